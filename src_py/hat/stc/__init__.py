@@ -1,34 +1,126 @@
 """Statechart library"""
 
+from hat.stc.codegen import (StepFunction,
+                             StepTable,
+                             GeneratedStatechart,
+                             compile_statechart,
+                             get_model_hash,
+                             generate_source)
 from hat.stc.common import (EventName,
                             StateName,
                             ActionName,
                             ConditionName,
+                            RegisterCallbackHandle,
+                            Action,
+                            Condition,
+                            HistoryType,
                             Event,
                             Transition,
-                            State)
-from hat.stc.dot import create_dot_graph
-from hat.stc.runner import (SyncRunner,
+                            State,
+                            get_descriptor_tokens,
+                            is_wildcard_descriptor)
+from hat.stc.encoder import (encode_states,
+                             decode_states)
+from hat.stc.dot import (DotHighlight,
+                         DotCache,
+                         create_dot_graph,
+                         write_dot_graph)
+from hat.stc.model import (StateIndex,
+                           CompiledTransition,
+                           CompiledState,
+                           Model,
+                           Coverage,
+                           ConditionProfiler)
+from hat.stc.monitor import (StateOverlay,
+                             TransitionOverlay,
+                             Overlay,
+                             Monitor,
+                             overlay_to_json,
+                             overlay_to_dot_highlight,
+                             coverage_to_dot_highlight)
+from hat.stc.pool import BufferPool
+from hat.stc.runner import (StateChangesCb,
+                            RunResult,
+                            QueueMetrics,
+                            SyncRunner,
+                            MailboxRunner,
                             AsyncRunner,
-                            AsyncTimer)
+                            AsyncTimer,
+                            SyncTimer,
+                            Timer)
 from hat.stc.scxml import parse_scxml
-from hat.stc.statechart import (Action,
-                                Condition,
-                                Statechart)
+from hat.stc.shm import (InstanceId,
+                         InstanceResolver,
+                         create_event_ring,
+                         connect_event_ring,
+                         EventRing)
+from hat.stc.statechart import (StateChange,
+                                StateChangeCb,
+                                MigrationCb,
+                                Statechart,
+                                create_statecharts,
+                                initialize_statecharts,
+                                migrate_statecharts)
 
 
-__all__ = ['EventName',
+__all__ = ['StepFunction',
+           'StepTable',
+           'GeneratedStatechart',
+           'compile_statechart',
+           'get_model_hash',
+           'generate_source',
+           'EventName',
            'StateName',
            'ActionName',
            'ConditionName',
+           'RegisterCallbackHandle',
+           'Action',
+           'Condition',
+           'HistoryType',
            'Event',
            'Transition',
            'State',
+           'get_descriptor_tokens',
+           'is_wildcard_descriptor',
+           'encode_states',
+           'decode_states',
+           'DotHighlight',
+           'DotCache',
            'create_dot_graph',
+           'write_dot_graph',
+           'StateIndex',
+           'CompiledTransition',
+           'CompiledState',
+           'Model',
+           'Coverage',
+           'ConditionProfiler',
+           'StateOverlay',
+           'TransitionOverlay',
+           'Overlay',
+           'Monitor',
+           'overlay_to_json',
+           'overlay_to_dot_highlight',
+           'coverage_to_dot_highlight',
+           'BufferPool',
+           'StateChangesCb',
+           'RunResult',
+           'QueueMetrics',
            'SyncRunner',
+           'MailboxRunner',
            'AsyncRunner',
            'AsyncTimer',
+           'SyncTimer',
+           'Timer',
            'parse_scxml',
-           'Action',
-           'Condition',
-           'Statechart']
+           'InstanceId',
+           'InstanceResolver',
+           'create_event_ring',
+           'connect_event_ring',
+           'EventRing',
+           'StateChange',
+           'StateChangeCb',
+           'MigrationCb',
+           'Statechart',
+           'create_statecharts',
+           'initialize_statecharts',
+           'migrate_statecharts']
@@ -0,0 +1,257 @@
+"""Static statechart analysis
+
+Analysis can be run as command line tool::
+
+    $ python -m hat.stc.analysis model.scxml
+
+"""
+
+from collections.abc import Iterable
+import argparse
+import enum
+import sys
+import typing
+
+from hat.stc.common import (StateName,
+                            Transition,
+                            State,
+                            get_descriptor_tokens)
+from hat.stc.scxml import parse_scxml
+
+
+class IssueType(enum.Enum):
+    DUPLICATE_STATE = 'duplicate state'
+    INVALID_TARGET = 'invalid target'
+    UNREACHABLE_STATE = 'unreachable state'
+    SHADOWED_TRANSITION = 'shadowed transition'
+
+
+class Issue(typing.NamedTuple):
+    """Statechart definition issue"""
+    type: IssueType
+    """Issue type"""
+    state: StateName
+    """State name"""
+    transition: Transition | None = None
+    """Transition (only for transition issues)"""
+
+
+class Statistics(typing.NamedTuple):
+    """Statechart definition statistics"""
+    state_count: int
+    """Number of states"""
+    transition_count: int
+    """Number of transitions"""
+    event_count: int
+    """Number of distinct event descriptors (equivalent descriptors, such
+    as ``error`` and ``error.*``, are counted once)"""
+    depth: int
+    """Maximum state nesting depth (``1`` for non hierarchical statechart)"""
+    fan_out: int
+    """Maximum number of child states"""
+    transitions_per_state: int
+    """Maximum number of transitions defined by single state"""
+    events_per_state: int
+    """Maximum number of distinct event descriptors handled by state
+    (including descriptors of ancestors' transitions)"""
+
+
+class Analysis(typing.NamedTuple):
+    """Analysis result"""
+    issues: list[Issue]
+    """Detected issues"""
+    statistics: Statistics
+    """Statistics"""
+
+
+def analyze(states: Iterable[State]) -> Analysis:
+    """Analyze state definitions
+
+    Detected issues include:
+
+        * duplicate state names
+        * transitions with invalid target state
+        * states which can not be reached from initial state
+        * transitions which can never be triggered because other
+          transitions (defined by same state or by all descendant states)
+          unconditionally handle all events matched by their event
+          descriptors (e.g. transition with descriptor ``error.io`` is
+          shadowed by preceding unconditional transition with descriptor
+          ``error`` or ``*``)
+
+    """
+    definitions = []
+    parents = []
+    children = []
+    depths = []
+    indices = {}
+    issues = []
+
+    stack = [(state, None) for state in reversed(list(states))]
+    while stack:
+        state, parent = stack.pop()
+
+        if state.name in indices:
+            issues.append(Issue(IssueType.DUPLICATE_STATE, state.name))
+
+        else:
+            indices[state.name] = len(definitions)
+
+        index = len(definitions)
+        definitions.append(state)
+        parents.append(parent)
+        children.append([])
+        depths.append(depths[parent] + 1 if parent is not None else 1)
+
+        if parent is not None:
+            children[parent].append(index)
+
+        stack.extend((child, index)
+                     for child in reversed(list(state.children)))
+
+    event_names = set()
+    handled_events = []
+    covered_events = [None] * len(definitions)
+    transition_count = 0
+
+    for index, state in enumerate(definitions):
+        parent = parents[index]
+        events = {tokens
+                  for transition in state.transitions
+                  for tokens in _get_event_tokens(transition.event)}
+        event_names.update(events)
+        handled_events.append(events | handled_events[parent]
+                              if parent is not None else events)
+        transition_count += len(state.transitions)
+
+        for transition in state.transitions:
+            if (transition.target is not None and
+                    transition.target not in indices):
+                issues.append(Issue(IssueType.INVALID_TARGET, state.name,
+                                    transition))
+
+    for index in reversed(range(len(definitions))):
+        state = definitions[index]
+        covered = _get_children_covered_events(
+            [child for child in children[index]
+             if not definitions[child].history],
+            covered_events)
+
+        for transition in state.transitions:
+            tokens = _get_event_tokens(transition.event)
+            if tokens and all(_is_covered(covered, i) for i in tokens):
+                issues.append(Issue(IssueType.SHADOWED_TRANSITION,
+                                    state.name, transition))
+
+            elif not transition.conditions:
+                covered.update(tokens)
+
+        covered_events[index] = covered
+
+    reachable = _get_reachable(definitions, parents, children, indices)
+    for index, state in enumerate(definitions):
+        if index not in reachable and indices.get(state.name) == index:
+            issues.append(Issue(IssueType.UNREACHABLE_STATE, state.name))
+
+    statistics = Statistics(
+        state_count=len(definitions),
+        transition_count=transition_count,
+        event_count=len(event_names),
+        depth=max(depths, default=0),
+        fan_out=max((len(i) for i in children), default=0),
+        transitions_per_state=max((len(state.transitions)
+                                   for state in definitions),
+                                  default=0),
+        events_per_state=max((len(events) for events in handled_events),
+                             default=0))
+
+    return Analysis(issues=issues,
+                    statistics=statistics)
+
+
+def main():
+    """Main entry point"""
+    parser = argparse.ArgumentParser(
+        prog='python -m hat.stc.analysis',
+        description='Statechart definition analysis')
+    parser.add_argument('paths', metavar='PATH', nargs='+',
+                        help='SCXML file path')
+    args = parser.parse_args()
+
+    result = 0
+    for path in args.paths:
+        with open(path, encoding='utf-8') as f:
+            states = parse_scxml(f)
+
+        analysis = analyze(states)
+        if analysis.issues:
+            result = 1
+
+        for issue in analysis.issues:
+            transition = (f" (event {issue.transition.event})"
+                          if issue.transition else "")
+            print(f"{path}: {issue.type.value} {issue.state}{transition}")
+
+        for name, value in analysis.statistics._asdict().items():
+            print(f"{path}: {name.replace('_', ' ')}: {value}")
+
+    return result
+
+
+def _get_event_tokens(event):
+    return [tuple(get_descriptor_tokens(descriptor))
+            for descriptor in event.split()]
+
+
+def _is_covered(covered, tokens):
+    return any(tokens[:i] in covered for i in range(len(tokens) + 1))
+
+
+def _get_children_covered_events(children, covered_events):
+    if not children:
+        return set()
+
+    return {tokens
+            for child in children
+            for tokens in covered_events[child]
+            if all(_is_covered(covered_events[i], tokens)
+                   for i in children)}
+
+
+def _get_reachable(definitions, parents, children, indices):
+    if not definitions:
+        return set()
+
+    reachable = set()
+    descended = set()
+    stack = [(0, True)]
+
+    while stack:
+        index, descend = stack.pop()
+
+        if descend and index not in descended:
+            descended.add(index)
+            initial = next((child for child in children[index]
+                            if not definitions[child].history), None)
+            if initial is not None:
+                stack.append((initial, True))
+
+        if index in reachable:
+            continue
+
+        reachable.add(index)
+
+        parent = parents[index]
+        if parent is not None:
+            stack.append((parent, False))
+
+        for transition in definitions[index].transitions:
+            target = indices.get(transition.target)
+            if target is not None:
+                stack.append((target, True))
+
+    return reachable
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,353 @@
+"""Statechart code generator
+
+Code generator creates Python module specialized for single statechart
+definition. For each combination of active state and event name, generated
+module contains function with all candidate transition guards, exit actions,
+transition actions and entry actions inlined as direct calls. Generated
+modules can be cached on disk - cached module is identified by hash of
+compiled model structure.
+
+"""
+
+from collections.abc import Callable, Iterable
+import hashlib
+import importlib.util
+import itertools
+import os
+import pathlib
+import sys
+import tempfile
+import typing
+import weakref
+
+from hat.stc.common import (EventName,
+                            Event,
+                            State)
+from hat.stc.model import CompiledTransition, Model
+from hat.stc.statechart import Statechart
+
+
+StepFunction: typing.TypeAlias = Callable[[Statechart, Event],
+                                          CompiledTransition | None]
+"""Generated step function"""
+
+StepTable: typing.TypeAlias = list[dict[EventName, StepFunction]]
+"""Generated step functions indexed by state index and event name"""
+
+
+class GeneratedStatechart(Statechart):
+    """Base class for generated statecharts
+
+    Generated statechart classes are created with `compile_statechart`.
+    Their instances are initialized with same arguments as `Statechart`
+    instances. Provided state definitions (or model) should match state
+    definitions used for code generation. Instances can be migrated (see
+    `Statechart.migrate`) to model with different structure - events of
+    such instances are processed by generic `Statechart` implementation.
+
+    """
+
+    __slots__ = ('_table',)
+
+    model_hash: str = ''
+    """Hash of model structure used for code generation"""
+
+    create_table: Callable[[Model], StepTable]
+    """Generated step table factory"""
+
+    def _init(self, model, context):
+        super()._init(model, context)
+        self._table = _get_table(type(self), model)
+
+    def _step(self, event):
+        state = self._state
+        if state is None:
+            return
+
+        fn = self._table[state].get(event.name)
+        if fn is None:
+            return super()._step(event)
+
+        transition = fn(self, event)
+        if transition is not None:
+            coverage = self._model._coverage
+            if coverage is not None:
+                coverage._transition_counts[transition.index] += 1
+
+        return transition
+
+    def _migrate(self, model, migration, migration_cb):
+        table = _get_table(type(self), model, fallback=True)
+        super()._migrate(model, migration, migration_cb)
+        self._table = table
+
+
+def compile_statechart(states: Iterable[State],
+                       cache_dir: pathlib.Path | None = None
+                       ) -> type[GeneratedStatechart]:
+    """Generate statechart class specialized for state definitions
+
+    If `cache_dir` is provided, generated module is stored in (or loaded
+    from) this directory together with its cached byte code.
+
+    Guards are evaluated in order defined by model (see `Model`) without
+    memoization of pure conditions results. Specialized functions are
+    generated only for event names used by transition descriptors - other
+    events are processed by `Statechart.step`.
+
+    """
+    model = _create_structural_model(states)
+    model_hash = get_model_hash(model)
+    module_name = f'hat.stc._generated_{model_hash[:16]}'
+    path = None
+
+    if cache_dir is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        path = cache_dir / f'stc_{model_hash}.py'
+        if not path.exists():
+            _write_source(path, generate_source(model))
+
+    cls = _classes.get(model_hash)
+    if cls:
+        return cls
+
+    if path is None:
+        source = generate_source(model)
+        module = type(sys)(module_name)
+        code = compile(source, f'<{module_name}>', 'exec')
+        exec(code, module.__dict__)
+
+    else:
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+    cls = module.Statechart
+    if cls.model_hash != model_hash:
+        raise ValueError('generated module hash mismatch')
+
+    _classes[model_hash] = cls
+    return cls
+
+
+def get_model_hash(model: Model) -> str:
+    """Calculate hash of model structure
+
+    Hash depends only on state and transition definitions - action and
+    condition implementations are not included.
+
+    """
+    h = hashlib.sha256(_generator_version.encode('utf-8'))
+
+    for state in model.states:
+        transitions = [(transition.event,
+                        transition.target,
+                        transition.ancestor,
+                        transition.entries,
+                        transition.history,
+                        transition.actions,
+                        transition.conditions,
+                        transition.internal)
+                       for transition in state.transitions]
+        h.update(repr((state.name,
+                       state.parent,
+                       state.children,
+                       state.entries,
+                       state.exits,
+                       state.final,
+                       state.history,
+                       state.history_slot,
+                       transitions)).encode('utf-8'))
+
+    return h.hexdigest()
+
+
+def generate_source(model: Model) -> str:
+    """Generate Python module source for model structure"""
+    return '\n'.join(_generate_source_lines(model))
+
+
+def _generate_source_lines(model):
+    model_hash = get_model_hash(model)
+    transition_indices = {}
+    for state in model.states:
+        for i, transition in enumerate(state.transitions):
+            transition_indices[id(transition)] = i
+
+    yield f'"""Generated statechart (model {model_hash})"""'
+    yield ''
+    yield 'from hat.stc.codegen import GeneratedStatechart'
+    yield ''
+    yield ''
+    yield 'def create_table(model):'
+    yield '    states = model.states'
+    yield ''
+
+    for index, state in enumerate(model.states):
+        for i in range(len(state.entries)):
+            yield f'    en_{index}_{i} = states[{index}].entry_actions[{i}]'
+
+        for i in range(len(state.exits)):
+            yield f'    ex_{index}_{i} = states[{index}].exit_actions[{i}]'
+
+        for t, transition in enumerate(state.transitions):
+            for i in range(len(transition.actions)):
+                yield (f'    ef_{index}_{t}_{i} = '
+                       f'states[{index}].transitions[{t}].effects[{i}]')
+
+            for i in range(len(transition.conditions)):
+                yield (f'    g_{index}_{t}_{i} = '
+                       f'states[{index}].transitions[{t}].guards[{i}]')
+
+            yield f'    t_{index}_{t} = states[{index}].transitions[{t}]'
+
+    table = []
+    for index, state in enumerate(model.states):
+        functions = {}
+        table.append(functions)
+
+        if state.final:
+            continue
+
+        for event, candidates in state.dispatch.items():
+            if not candidates:
+                continue
+
+            name = f'fn_{index}_{len(functions)}'
+            functions[event] = name
+
+            yield ''
+            yield f'    def {name}(stc, event):'
+            yield from _generate_function_body(model, index, candidates,
+                                               transition_indices)
+
+    yield ''
+    yield '    return ['
+    for functions in table:
+        items = ', '.join(f'{event!r}: {name}'
+                          for event, name in functions.items())
+        yield f'        {{{items}}},'
+    yield '    ]'
+
+    yield ''
+    yield ''
+    yield 'class Statechart(GeneratedStatechart):'
+    yield '    __slots__ = ()'
+    yield f'    model_hash = {model_hash!r}'
+    yield '    create_table = staticmethod(create_table)'
+    yield ''
+
+
+def _generate_function_body(model, index, candidates, transition_indices):
+    for transition in candidates:
+        source = transition.source
+        t = transition_indices[id(transition)]
+        guards = [f'g_{source}_{t}_{i}(stc, event)'
+                  for i in range(len(transition.conditions))]
+        indent = ' ' * 8
+
+        if guards:
+            yield f"{indent}if {' and '.join(guards)}:"
+            indent = ' ' * 12
+
+        body = list(_generate_transition_lines(model, index, transition, t))
+        for line in body:
+            yield f'{indent}{line}'
+        yield f'{indent}return t_{source}_{t}'
+
+        if not guards:
+            break
+
+
+def _generate_transition_lines(model, index, transition, t):
+    states = model.states
+    source = transition.source
+
+    if transition.target is not None:
+        state = index
+        while state != transition.ancestor:
+            for i in range(len(states[state].exits)):
+                yield f'ex_{state}_{i}(stc, event)'
+            if states[state].history_slot is not None:
+                yield f'stc._history[{states[state].history_slot}] = {index}'
+            state = states[state].parent
+            yield f'stc._state = {state}'
+
+    for i in range(len(transition.actions)):
+        yield f'ef_{source}_{t}_{i}(stc, event)'
+
+    for state in transition.entries:
+        yield f'stc._state = {state}'
+        for i in range(len(states[state].entries)):
+            yield f'en_{state}_{i}(stc, event)'
+
+    if transition.history is not None:
+        yield f'stc._restore_history({transition.history}, event)'
+
+
+def _create_structural_model(states):
+    states = list(states)
+    action_names = set()
+    condition_names = set()
+
+    stack = list(states)
+    while stack:
+        state = stack.pop()
+        stack.extend(state.children)
+        action_names.update(itertools.chain(state.entries, state.exits))
+        for transition in state.transitions:
+            action_names.update(transition.actions)
+            condition_names.update(transition.conditions)
+
+    return Model(states,
+                 {name: _noop for name in action_names},
+                 {name: _noop for name in condition_names})
+
+
+def _get_table(cls, model, fallback=False):
+    tables = _tables.setdefault(cls, weakref.WeakKeyDictionary())
+    entry = tables.get(model)
+    if entry is None:
+        supported = get_model_hash(model) == cls.model_hash
+        table = (cls.create_table(model) if supported
+                 else [{}] * len(model.states))
+        entry = tables[model] = table, supported
+
+    table, supported = entry
+    if not supported and not fallback:
+        raise ValueError('model not supported by generated statechart')
+
+    return table
+
+
+def _write_source(path, source):
+    with tempfile.NamedTemporaryFile('w',
+                                     encoding='utf-8',
+                                     dir=path.parent,
+                                     prefix=f'{path.stem}_',
+                                     suffix='.tmp',
+                                     delete=False) as f:
+        tmp_path = f.name
+
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(source)
+
+        os.replace(tmp_path, path)
+
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _noop(_, __):
+    pass
+
+
+_generator_version = '4'
+
+_classes: dict[str, type[GeneratedStatechart]] = {}
+
+_tables: dict[type[GeneratedStatechart],
+              weakref.WeakKeyDictionary[Model, tuple[StepTable, bool]]] = {}
@@ -1,6 +1,10 @@
-from collections.abc import Collection
+from collections.abc import Callable, Collection
+import enum
 import typing
 
+if typing.TYPE_CHECKING:
+    from hat.stc.statechart import Statechart
+
 
 EventName: typing.TypeAlias = str
 """Event name"""
@@ -15,6 +19,17 @@ ConditionName: typing.TypeAlias = str
 """Condition name"""
 
 
+class RegisterCallbackHandle(typing.NamedTuple):
+    """Handle for canceling callback registration"""
+    cancel: Callable[[], None]
+    """Cancel callback registration"""
+
+
+class HistoryType(enum.Enum):
+    SHALLOW = 'shallow'
+    DEEP = 'deep'
+
+
 class Event(typing.NamedTuple):
     """Event instance"""
     name: EventName
@@ -26,8 +41,13 @@ class Event(typing.NamedTuple):
 class Transition(typing.NamedTuple):
     """Transition definition"""
     event: EventName
-    """Event identifier. Occurrence of event with this exact identifier can
-    trigger state transition."""
+    """Event descriptors. Space separated list of SCXML event descriptors
+    - transition can be triggered by event whose name matches any of
+    descriptors. Descriptor matches event name if it is equal to event name
+    or to its prefix consisting of whole dot separated tokens (e.g.
+    descriptor ``error`` matches ``error`` and ``error.io.read``). Descriptor
+    can be terminated by ``.*`` which has same meaning as descriptor without
+    this suffix. Descriptor ``*`` matches all event names."""
     target: StateName | None
     """Destination state identifier. If destination state is not defined,
     local transition is assumed - state is not changed and transition
@@ -48,8 +68,8 @@ class State(typing.NamedTuple):
     name: StateName
     """Unique state identifier."""
     children: Collection['State'] = []
-    """Optional child states. If state has children, first child is
-    considered as its initial state."""
+    """Optional child states. If state has children, first child (which is
+    not history pseudo-state) is considered as its initial state."""
     transitions: Collection[Transition] = []
     """Possible transitions to other states."""
     entries: Collection[ActionName] = []
@@ -58,3 +78,53 @@ class State(typing.NamedTuple):
     """Actions executed when state is exited."""
     final: bool = False
     """Is state final."""
+    history: HistoryType | None = None
+    """History pseudo-state type. If set, this state represents history of
+    its parent state and can only be used as transition target. Transition
+    to history pseudo-state enters parent's child state which was active
+    when parent was last exited (shallow history) or all parent's
+    descendant states which were active when parent was last exited (deep
+    history). If parent was never exited, parent's initial state is
+    entered."""
+
+
+Action: typing.TypeAlias = Callable[['Statechart',
+                                     Event | None],
+                                    None]
+"""Action function
+
+Action implementation which can be executed as part of entering/exiting
+state or transition execution. It is called with statechart instance and
+`Event` which triggered transition. In case of initial actions, run during
+transition to initial state, it is called with ``None``.
+
+"""
+
+Condition: typing.TypeAlias = Callable[['Statechart',
+                                        Event | None],
+                                       bool]
+"""Condition function
+
+Condition implementation used as transition guard. It is called with statechart
+instance and `Event` which triggered transition. Return value ``True`` is
+interpreted as satisfied condition.
+
+"""
+
+
+def get_descriptor_tokens(descriptor: str) -> list[str]:
+    """Get dot separated tokens of single event descriptor
+
+    Trailing ``*`` token (and empty tokens) are omitted - descriptor ``*``
+    results in empty list which matches all event names.
+
+    """
+    tokens = descriptor.split('.')
+    while tokens and tokens[-1] in ('', '*'):
+        tokens.pop()
+    return tokens
+
+
+def is_wildcard_descriptor(descriptor: str) -> bool:
+    """Is single event descriptor terminated by ``*`` token"""
+    return descriptor == '*' or descriptor.endswith('.*')
@@ -1,74 +1,261 @@
 from collections.abc import Iterable
+import io
+import typing
 
-from hat.stc.common import State
+from hat.stc.common import StateName, HistoryType, State
 
 
-def create_dot_graph(states: Iterable[State]) -> str:
-    """Create DOT representation of statechart"""
-    state_name_ids = {}
-    id_prefix = 'state'
-    states_dot = '\n'.join(
-        _create_dot_graph_states(states, state_name_ids, id_prefix))
-    transitions_dot = '\n'.join(
-        _create_dot_graph_transitions(states, state_name_ids, id_prefix))
-    return _dot_graph.format(states=states_dot,
-                             transitions=transitions_dot)
+class DotHighlight(typing.NamedTuple):
+    """Highlighted DOT graph elements
 
+    Highlighted states and transitions are drawn with highlight color and
+    annotated with provided text.
 
-def _create_dot_graph_states(states, state_name_ids, id_prefix):
+    """
+    states: dict[StateName, str]
+    """State annotations"""
+    transitions: dict[tuple[StateName, int], str]
+    """Transition annotations (transitions are identified by source state
+    name and position of transition in source state's transitions)"""
+    state_colors: dict[StateName, str] = {}
+    """State highlight colors (``red`` by default)"""
+    transition_colors: dict[tuple[StateName, int], str] = {}
+    """Transition highlight colors (``red`` by default)"""
+
+
+class DotCache:
+    """Cache of DOT fragments
+
+    Cache stores formatted state and transition labels associated with
+    state and transition definition instances. It can be reused between
+    multiple calls of `write_dot_graph` (or `create_dot_graph`) with mostly
+    unchanged state definitions - labels of state and transition definition
+    instances which were used in previous call are not formatted again.
+    After each call, only fragments of definitions used in that call are
+    kept.
+
+    """
+
+    def __init__(self):
+        self._fragments = {}
+        self._next_fragments = {}
+
+    def _get_state_label(self, state):
+        return self._get(state, _create_dot_graph_state_label)
+
+    def _get_transition_label(self, transition):
+        return self._get(transition, _create_dot_graph_transition_label)
+
+    def _get(self, obj, fn):
+        key = id(obj)
+        entry = self._next_fragments.get(key)
+        if entry is None:
+            entry = self._fragments.get(key)
+            if entry is None or entry[0] is not obj:
+                entry = obj, fn(obj)
+            self._next_fragments[key] = entry
+        return entry[1]
+
+    def _swap(self):
+        self._fragments, self._next_fragments = self._next_fragments, {}
+
+
+def create_dot_graph(states: Iterable[State],
+                     root: StateName | None = None,
+                     max_depth: int | None = None,
+                     cache: DotCache | None = None,
+                     highlight: DotHighlight | None = None
+                     ) -> str:
+    """Create DOT representation of statechart
+
+    See `write_dot_graph`.
+
+    """
+    f = io.StringIO()
+    write_dot_graph(f, states, root, max_depth, cache, highlight)
+    return f.getvalue()
+
+
+def write_dot_graph(f: typing.TextIO,
+                    states: Iterable[State],
+                    root: StateName | None = None,
+                    max_depth: int | None = None,
+                    cache: DotCache | None = None,
+                    highlight: DotHighlight | None = None):
+    """Write DOT representation of statechart
+
+    DOT representation is written to `f` incrementally, state by state.
+
+    If `root` is provided, only subtree with root in state named `root` is
+    written (transitions with targets outside of this subtree are omitted).
+
+    If `max_depth` is provided, only states with depth less or equal to
+    `max_depth` are written (top level states have depth ``1``).
+    Transitions with hidden target states are represented as transitions to
+    their closest visible ancestor and transitions of hidden states are
+    omitted.
+
+    If `highlight` is provided, highlighted states and transitions are
+    annotated and drawn with highlight color (see `DotHighlight`).
+
+    """
+    states = list(states)
+    if root is not None:
+        states = [_find_state(states, root)]
+
+    if cache is None:
+        cache = DotCache()
+
+    if highlight is None:
+        highlight = _no_highlight
+
+    state_ids = {}
+    history_ids = set()
+
+    f.write(_dot_graph_header)
+    _write_states(f, states, state_ids, history_ids, 'state', 1, max_depth,
+                  cache, highlight)
+    f.write(_dot_graph_middle)
+
+    separator = ''
+    for transition in _create_dot_graph_transitions(states, state_ids,
+                                                    history_ids, 'state', 1,
+                                                    max_depth, cache,
+                                                    highlight):
+        f.write(separator)
+        f.write(transition)
+        separator = '\n'
+
+    f.write(_dot_graph_footer)
+    cache._swap()
+
+
+def _find_state(states, name):
+    stack = list(states)
+    while stack:
+        state = stack.pop()
+        if state.name == name:
+            return state
+        stack.extend(state.children)
+
+    raise ValueError(f'state {name} not found')
+
+
+def _write_states(f, states, state_ids, history_ids, id_prefix, depth,
+                  max_depth, cache, highlight):
     if not states:
         return
-    yield _dot_graph_initial.format(id=f'{id_prefix}_initial')
+
+    f.write(_dot_graph_initial.format(id=f'{id_prefix}_initial'))
+
     for i, state in enumerate(states):
         state_id = f'{id_prefix}_{i}'
-        state_name_ids[state.name] = state_id
-        actions = '\n'.join(_create_dot_graph_state_actions(state))
-        separator = _dot_graph_separator if actions else ''
-        children = '\n'.join(
-            _create_dot_graph_states(state.children, state_name_ids, state_id))
-        yield _dot_graph_state.format(id=state_id,
-                                      name=state.name,
-                                      separator=separator,
-                                      actions=actions,
-                                      children=children)
+        state_ids[state.name] = state_id
+        f.write('\n')
+
+        if state.history:
+            history_ids.add(state_id)
+            label = 'H*' if state.history == HistoryType.DEEP else 'H'
+            f.write(_dot_graph_history.format(id=state_id,
+                                              label=label))
+            continue
+
+        name, separator, actions = cache._get_state_label(state)
+        attributes = ''
+        annotation = highlight.states.get(state.name)
+        if annotation is not None:
+            color = highlight.state_colors.get(state.name, 'red')
+            name = _dot_graph_annotation.format(name=name,
+                                                annotation=annotation,
+                                                color=color)
+            attributes = _dot_graph_state_highlight.format(color=color)
+
+        f.write(_dot_graph_state_prefix.format(id=state_id,
+                                               name=name,
+                                               separator=separator,
+                                               actions=actions,
+                                               attributes=attributes))
+
+        if max_depth is None or depth < max_depth:
+            _write_states(f, state.children, state_ids, history_ids,
+                          state_id, depth + 1, max_depth, cache, highlight)
+
+        else:
+            _hide_states(state.children, state_ids, state_id)
+
+        f.write(_dot_graph_state_suffix.format(id=state_id))
+
+
+def _hide_states(states, state_ids, state_id):
+    stack = list(states)
+    while stack:
+        state = stack.pop()
+        state_ids[state.name] = state_id
+        stack.extend(state.children)
+
+
+def _create_dot_graph_state_label(state):
+    actions = '\n'.join(_create_dot_graph_state_actions(state))
+    separator = _dot_graph_separator if actions else ''
+    return state.name, separator, actions
 
 
 def _create_dot_graph_state_actions(state):
     for name in state.entries:
         yield _dot_graph_state_action.format(type='entry', name=name)
-    for name in state.entries:
+    for name in state.exits:
         yield _dot_graph_state_action.format(type='exit', name=name)
 
 
-def _create_dot_graph_transitions(states, state_name_ids, id_prefix):
-    if not states:
+def _create_dot_graph_transitions(states, state_ids, history_ids, id_prefix,
+                                  depth, max_depth, cache, highlight):
+    initial = next((i for i, state in enumerate(states)
+                    if not state.history), None)
+    if initial is None:
         return
     yield _dot_graph_transition.format(src_id=f'{id_prefix}_initial',
-                                       dst_id=f'{id_prefix}_0',
+                                       dst_id=f'{id_prefix}_{initial}',
                                        label='""',
-                                       lhead=f'cluster_{id_prefix}_0',
-                                       ltail='')
+                                       lhead=f'cluster_{id_prefix}_{initial}',
+                                       ltail='',
+                                       attributes='')
     for state in states:
-        src_id = state_name_ids[state.name]
-        for transition in state.transitions:
-            dst_id = (state_name_ids[transition.target] if transition.target
+        src_id = state_ids[state.name]
+        for i, transition in enumerate(state.transitions):
+            if transition.target and transition.target not in state_ids:
+                continue
+            dst_id = (state_ids[transition.target] if transition.target
                       else src_id)
-            label = _create_dot_graph_transition_label(transition)
+            label = cache._get_transition_label(transition)
             lhead = f'cluster_{dst_id}'
             ltail = f'cluster_{src_id}'
+            if dst_id in history_ids:
+                lhead = ''
             if lhead == ltail:
                 lhead, ltail = '', ''
             elif ltail.startswith(lhead):
                 lhead = ''
             elif lhead.startswith(ltail):
                 ltail = ''
+            annotation = highlight.transitions.get((state.name, i))
+            attributes = (
+                _dot_graph_transition_highlight.format(
+                    annotation=annotation,
+                    color=highlight.transition_colors.get((state.name, i),
+                                                          'red'))
+                if annotation is not None else '')
             yield _dot_graph_transition.format(src_id=src_id,
                                                dst_id=dst_id,
                                                label=label,
                                                lhead=lhead,
-                                               ltail=ltail)
-        yield from _create_dot_graph_transitions(state.children,
-                                                 state_name_ids, src_id)
+                                               ltail=ltail,
+                                               attributes=attributes)
+        if max_depth is None or depth < max_depth:
+            yield from _create_dot_graph_transitions(state.children,
+                                                     state_ids, history_ids,
+                                                     src_id, depth + 1,
+                                                     max_depth, cache,
+                                                     highlight)
 
 
 def _create_dot_graph_transition_label(transition):
@@ -116,6 +303,11 @@ _dot_graph = r"""digraph "stc" {{
 }}
 """
 
+_dot_graph_header, _dot_graph_middle, _dot_graph_footer = (
+    _dot_graph.replace('{{', '{').replace('}}', '}')
+    .replace('{states}', '\0').replace('{transitions}', '\0')
+    .split('\0'))
+
 _dot_graph_initial = r"""{id} [
     shape = circle
     style = filled
@@ -134,7 +326,7 @@ _dot_graph_state = r"""subgraph "cluster_{id}" {{
         </table>
     >
     style = rounded
-    penwidth = 2.0
+    penwidth = 2.0{attributes}
     {children}
     {id} [
         shape=point
@@ -146,14 +338,37 @@ _dot_graph_state = r"""subgraph "cluster_{id}" {{
     ]
 }}"""
 
+_dot_graph_state_prefix, _dot_graph_state_suffix = (
+    _dot_graph_state.replace('{children}', '\0').split('\0'))
+
+_dot_graph_history = r"""{id} [
+    shape = circle
+    fixedsize = true
+    width = 0.3
+    label = "{label}"
+]"""
+
 _dot_graph_separator = "<hr/>"
 
+_dot_graph_annotation = (r"""{name}<br/>"""
+                         r"""<font color="{color}">{annotation}</font>""")
+
+_dot_graph_state_highlight = '\n    color = "{color}"'
+
+_dot_graph_transition_highlight = r"""
+    color = "{color}"
+    fontcolor = "{color}"
+    penwidth = 2.0
+    xlabel = <{annotation}>"""
+
+_no_highlight = DotHighlight(states={}, transitions={})
+
 _dot_graph_state_action = r"""<tr><td align="left">{type}/ {name}</td></tr>"""
 
 _dot_graph_transition = r"""{src_id} -> {dst_id} [
     label = {label}
     lhead = "{lhead}"
-    ltail = "{ltail}"
+    ltail = "{ltail}"{attributes}
 ]"""
 
 _dot_graph_transition_label = r"""<
@@ -0,0 +1,102 @@
+"""State definitions encoder
+
+State definitions can be encoded as JSON serializable data and decoded back
+to state definitions. Encoded data can be serialized with `json` module (or
+any other serializer supporting lists, dicts, strings and booleans)::
+
+    data = json.dumps(encode_states(states))
+    states = decode_states(json.loads(data))
+
+Each state is encoded as dict with ``name`` key and optional ``children``,
+``transitions``, ``entries``, ``exits``, ``final`` and ``history`` keys.
+Each transition is encoded as dict with ``event`` key and optional
+``target``, ``actions``, ``conditions`` and ``internal`` keys. Optional keys
+are omitted if they have default values.
+
+Decoded state definitions are equal to definitions returned by
+`hat.stc.parse_scxml` for same statechart.
+
+"""
+
+from collections.abc import Iterable
+import typing
+
+from hat.stc.common import HistoryType, State, Transition
+
+
+Data: typing.TypeAlias = (None | bool | int | float | str |
+                          list['Data'] | dict[str, 'Data'])
+"""JSON serializable data"""
+
+
+def encode_states(states: Iterable[State]) -> list[Data]:
+    """Encode state definitions"""
+    return [_encode_state(state) for state in states]
+
+
+def decode_states(data: list[Data]) -> list[State]:
+    """Decode state definitions"""
+    return [_decode_state(i) for i in data]
+
+
+def _encode_state(state):
+    data = {'name': state.name}
+
+    if state.children:
+        data['children'] = [_encode_state(i) for i in state.children]
+
+    if state.transitions:
+        data['transitions'] = [_encode_transition(i)
+                               for i in state.transitions]
+
+    if state.entries:
+        data['entries'] = list(state.entries)
+
+    if state.exits:
+        data['exits'] = list(state.exits)
+
+    if state.final:
+        data['final'] = True
+
+    if state.history:
+        data['history'] = state.history.value
+
+    return data
+
+
+def _encode_transition(transition):
+    data = {'event': transition.event}
+
+    if transition.target is not None:
+        data['target'] = transition.target
+
+    if transition.actions:
+        data['actions'] = list(transition.actions)
+
+    if transition.conditions:
+        data['conditions'] = list(transition.conditions)
+
+    if transition.internal:
+        data['internal'] = True
+
+    return data
+
+
+def _decode_state(data):
+    get = data.get
+    history = get('history')
+    if history:
+        return State(name=data['name'],
+                     history=HistoryType(history))
+
+    return State(name=data['name'],
+                 children=[_decode_state(i) for i in get('children', ())],
+                 transitions=[Transition(event=i['event'],
+                                         target=i.get('target'),
+                                         actions=i.get('actions', []),
+                                         conditions=i.get('conditions', []),
+                                         internal=i.get('internal', False))
+                              for i in get('transitions', ())],
+                 entries=get('entries', []),
+                 exits=get('exits', []),
+                 final=get('final', False))
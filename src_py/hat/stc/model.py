@@ -0,0 +1,670 @@
+"""Compiled statechart model"""
+
+from collections.abc import Collection, Iterable
+import math
+import time
+import typing
+
+from hat.stc.common import (EventName,
+                            StateName,
+                            ActionName,
+                            ConditionName,
+                            Action,
+                            Condition,
+                            Event,
+                            HistoryType,
+                            State,
+                            get_descriptor_tokens,
+                            is_wildcard_descriptor)
+
+
+StateIndex: typing.TypeAlias = int
+"""Index of compiled state"""
+
+
+class CompiledTransition(typing.NamedTuple):
+    """Compiled transition"""
+    index: int
+    """Transition index (unique in model)"""
+    event: EventName
+    """Event descriptors"""
+    source: StateIndex
+    """Source state index"""
+    target: StateIndex | None
+    """Destination state index (``None`` for local transitions)"""
+    ancestor: StateIndex | None
+    """Index of deepest state which is not exited during transition
+    (``None`` if all active states are exited)"""
+    entries: tuple[StateIndex, ...]
+    """Indices of states entered during transition (ordered from outermost
+    to innermost state)"""
+    history: StateIndex | None
+    """Target history pseudo-state index (states entered based on history
+    are entered after `entries`)"""
+    actions: tuple[ActionName, ...]
+    """Transition actions"""
+    effects: tuple[Action, ...]
+    """Transition action implementations"""
+    conditions: tuple[ConditionName, ...]
+    """Transition conditions"""
+    guards: tuple[Condition, ...]
+    """Condition implementations (ordered by evaluation order)"""
+    internal: bool
+    """Internal transition modifier"""
+
+
+class CompiledState(typing.NamedTuple):
+    """Compiled state"""
+    name: StateName
+    """State name"""
+    parent: StateIndex | None
+    """Parent state index"""
+    children: tuple[StateIndex, ...]
+    """Child state indices (first child is initial)"""
+    transitions: tuple[CompiledTransition, ...]
+    """Transitions defined by this state"""
+    dispatch: dict[EventName, tuple[CompiledTransition, ...]]
+    """Candidate transitions for each event name, including transitions
+    defined by ancestors, ordered by priority (prepopulated for event names
+    used by descriptors of this state and its ancestors and extended by
+    `Model.get_candidates`). States without transitions share dispatch
+    table with their parent."""
+    entries: tuple[ActionName, ...]
+    """Entry actions"""
+    exits: tuple[ActionName, ...]
+    """Exit actions"""
+    entry_actions: tuple[Action, ...]
+    """Entry action implementations"""
+    exit_actions: tuple[Action, ...]
+    """Exit action implementations"""
+    final: bool
+    """Is state final"""
+    history: HistoryType | None
+    """History pseudo-state type"""
+    history_slot: int | None
+    """Index of slot used for recording history of this state (only for
+    states containing history pseudo-states)"""
+    path: tuple[StateIndex, ...]
+    """Indices of this state and its ancestors (ordered from outermost to
+    innermost state)"""
+    descent: tuple[StateIndex, ...]
+    """Indices of this state and its initial descendants (ordered from
+    outermost to innermost state)"""
+
+
+class Model:
+    """Compiled statechart model
+
+    Model is created from state definitions (first state is considered
+    initial) and action and condition definitions. During compilation, each
+    state is assigned index and all state transitions are resolved - for each
+    transition, states exited and entered are calculated in advance. All
+    collections are converted to tuples and events without payload are
+    preallocated for each event name used by transitions (see
+    `Model.get_event`).
+
+    Transition event descriptors are indexed with per state trie of event
+    name tokens. Matching of event name, which was not previously matched in
+    the same state, requires single trie traversal for each active state.
+
+    Structurally identical parts of compiled states are shared: equal
+    action and condition tuples (together with their resolved
+    implementations), index tuples and tries of states with equal event
+    descriptors are represented by single instance. States without
+    transitions share dispatch table with their parent (or with all other
+    states without transitions in their ancestry), so dispatch tables are
+    calculated only for states defining transitions.
+
+    Single model can be shared between arbitrary number of `Statechart`
+    instances.
+
+    Actions and conditions are resolved to their implementations during
+    compilation. If any action or condition used by state definitions is not
+    defined, `ValueError` is raised. `ValueError` is also raised in case of
+    duplicate state names, invalid transition targets or invalid history
+    pseudo-states (see `hat.stc.analysis.analyze` for detailed definition
+    analysis).
+
+    History of state containing history pseudo-states is recorded by
+    statechart instances in history slot - model assigns one slot to each
+    such state.
+
+    Conditions listed in `pure_conditions` are considered to be side effect
+    free functions of statechart and event - during single step, each pure
+    condition is evaluated at most once and its result is reused for all
+    other candidate transitions guarded by the same condition.
+
+    If `condition_ranks` are provided, conditions of each transition are
+    evaluated in ascending rank order (conditions without rank are evaluated
+    last, in their definition order). Ranks can be obtained by profiling
+    (see `ConditionProfiler`). Reordering should be used only with side
+    effect free conditions.
+
+    Args:
+        states: all state definitions with (first state is initial)
+        actions: mapping of action names to their implementation
+        conditions: mapping of conditions names to their implementation
+        pure_conditions: names of side effect free conditions
+        condition_ranks: condition evaluation ranks
+
+    """
+
+    def __init__(self,
+                 states: Iterable[State],
+                 actions: dict[ActionName, Action],
+                 conditions: dict[ConditionName, Condition] = {},
+                 pure_conditions: Collection[ConditionName] = [],
+                 condition_ranks: dict[ConditionName, float] = {}):
+        definitions = []
+        parents = []
+        children = []
+        indices = {}
+
+        stack = [(state, None) for state in reversed(list(states))]
+        while stack:
+            state, parent = stack.pop()
+            index = len(definitions)
+
+            if state.name in indices:
+                raise ValueError(f'duplicate state {state.name}')
+
+            if state.history and (parent is None or state.children or
+                                  state.transitions or state.entries or
+                                  state.exits or state.final):
+                raise ValueError(f'invalid history state {state.name}')
+
+            definitions.append(state)
+            parents.append(parent)
+            children.append([])
+            indices[state.name] = index
+
+            if parent is not None:
+                children[parent].append(index)
+
+            stack.extend((child, index)
+                         for child in reversed(list(state.children)))
+
+        paths = []
+        for index, parent in enumerate(parents):
+            paths.append((*paths[parent], index) if parent is not None
+                         else (index, ))
+
+        initials = [next((child for child in children[index]
+                          if not definitions[child].history), None)
+                    for index in range(len(definitions))]
+
+        descents = [()] * len(definitions)
+        for index in reversed(range(len(definitions))):
+            initial = initials[index]
+            descents[index] = ((index, *descents[initial])
+                               if initial is not None else (index, ))
+
+        history_slots = {}
+        for index, state in enumerate(definitions):
+            if state.history and parents[index] not in history_slots:
+                history_slots[parents[index]] = len(history_slots)
+
+        compiled_states = []
+        event_names = {}
+
+        undefined_actions = set()
+        undefined_conditions = set()
+
+        interned = {}
+        effects_cache = {}
+        guards_cache = {}
+        tries_cache = {}
+
+        def intern(value):
+            return interned.setdefault(value, value)
+
+        def get_names(names):
+            return intern(tuple(names))
+
+        def get_effects(names):
+            effects = effects_cache.get(names)
+            if effects is not None:
+                return effects
+
+            effects = []
+            for name in names:
+                effect = actions.get(name)
+                if effect is None:
+                    undefined_actions.add(name)
+                effects.append(effect)
+
+            effects = effects_cache[names] = intern(tuple(effects))
+            return effects
+
+        def get_guards(names):
+            guards = guards_cache.get(names)
+            if guards is not None:
+                return guards
+
+            guards = []
+            for name in sorted(names,
+                               key=lambda i: condition_ranks.get(i,
+                                                                 math.inf)):
+                guard = conditions.get(name)
+                if guard is None:
+                    undefined_conditions.add(name)
+                guards.append(guard)
+
+            guards = guards_cache[names] = intern(tuple(guards))
+            return guards
+
+        def get_trie(descriptors):
+            trie = tries_cache.get(descriptors)
+            if trie is not None:
+                return trie
+
+            trie = tries_cache[descriptors] = {}
+            for position, event in enumerate(descriptors):
+                for descriptor in event.split():
+                    tokens = get_descriptor_tokens(descriptor)
+                    if not is_wildcard_descriptor(descriptor):
+                        event_names[descriptor] = None
+
+                    node = trie
+                    for token in tokens:
+                        node = node.setdefault(token, {})
+                    node[None] = (*node.get(None, ()), position)
+
+            return trie
+
+        all_transitions = []
+        tries = []
+        dispatches = []
+        shared_dispatch = {}
+
+        for index, state in enumerate(definitions):
+            transitions = []
+            trie = (get_trie(tuple(transition.event
+                                   for transition in state.transitions))
+                    if state.transitions else None)
+
+            if trie is not None:
+                dispatch = {}
+
+            elif parents[index] is not None:
+                dispatch = dispatches[parents[index]]
+
+            else:
+                dispatch = shared_dispatch
+
+            for transition in state.transitions:
+                transition_actions = get_names(transition.actions)
+                transition_conditions = get_names(transition.conditions)
+
+                if transition.target is None:
+                    transitions.append(CompiledTransition(
+                        index=len(all_transitions) + len(transitions),
+                        event=transition.event,
+                        source=index,
+                        target=None,
+                        ancestor=None,
+                        entries=(),
+                        history=None,
+                        actions=transition_actions,
+                        effects=get_effects(transition_actions),
+                        conditions=transition_conditions,
+                        guards=get_guards(transition_conditions),
+                        internal=transition.internal))
+                    continue
+
+                target = indices.get(transition.target)
+                if target is None:
+                    raise ValueError(f'invalid transition target '
+                                     f'{transition.target}')
+
+                ancestor = _find_ancestor(paths[index], paths[target],
+                                          transition.internal)
+                path = paths[target]
+                entries = (*path[len(paths[ancestor])
+                                 if ancestor is not None else 0:],
+                           *descents[target][1:])
+                history = None
+
+                if definitions[target].history:
+                    entries, history = entries[:-1], target
+
+                entries = intern(entries)
+
+                transitions.append(CompiledTransition(
+                    index=len(all_transitions) + len(transitions),
+                    event=transition.event,
+                    source=index,
+                    target=target,
+                    ancestor=ancestor,
+                    entries=entries,
+                    history=history,
+                    actions=transition_actions,
+                    effects=get_effects(transition_actions),
+                    conditions=transition_conditions,
+                    guards=get_guards(transition_conditions),
+                    internal=transition.internal))
+
+            state_entries = get_names(state.entries)
+            state_exits = get_names(state.exits)
+
+            all_transitions.extend(transitions)
+            tries.append(trie)
+            dispatches.append(dispatch)
+            compiled_states.append(CompiledState(
+                name=state.name,
+                parent=parents[index],
+                children=intern(tuple(children[index])),
+                transitions=tuple(transitions),
+                dispatch=dispatch,
+                entries=state_entries,
+                exits=state_exits,
+                entry_actions=get_effects(state_entries),
+                exit_actions=get_effects(state_exits),
+                final=state.final,
+                history=state.history,
+                history_slot=history_slots.get(index),
+                path=paths[index],
+                descent=descents[index]))
+
+        if undefined_actions or undefined_conditions:
+            raise ValueError(
+                'undefined ' +
+                ', '.join([*(f'action {i}'
+                             for i in sorted(undefined_actions)),
+                           *(f'condition {i}'
+                             for i in sorted(undefined_conditions))]))
+
+        self._actions = actions
+        self._conditions = conditions
+        self._states = compiled_states
+        self._transitions = all_transitions
+        self._indices = indices
+        self._initial = descents[0] if descents else ()
+        self._history_count = len(history_slots)
+        self._pure_guards = frozenset(conditions[name]
+                                      for name in pure_conditions
+                                      if name in conditions)
+        self._events = {name: Event(name) for name in event_names}
+        self._tries = tries
+        self._coverage = None
+
+        for index, state in enumerate(compiled_states):
+            if tries[index] is None:
+                continue
+
+            ancestor = index
+            while ancestor is not None:
+                for transition in definitions[ancestor].transitions:
+                    for name in transition.event.split():
+                        if (name in state.dispatch or
+                                is_wildcard_descriptor(name)):
+                            continue
+
+                        state.dispatch[name] = self._match(index, name)
+
+                ancestor = parents[ancestor]
+
+    @property
+    def actions(self) -> dict[ActionName, Action]:
+        """Action definitions"""
+        return self._actions
+
+    @property
+    def conditions(self) -> dict[ConditionName, Condition]:
+        """Condition definitions"""
+        return self._conditions
+
+    @property
+    def pure_guards(self) -> frozenset[Condition]:
+        """Implementations of pure conditions"""
+        return self._pure_guards
+
+    @property
+    def states(self) -> list[CompiledState]:
+        """Compiled states (indexed by state index)"""
+        return self._states
+
+    @property
+    def transitions(self) -> list[CompiledTransition]:
+        """Compiled transitions (indexed by transition index)"""
+        return self._transitions
+
+    @property
+    def initial(self) -> tuple[StateIndex, ...]:
+        """Indices of states entered during initialization"""
+        return self._initial
+
+    @property
+    def history_count(self) -> int:
+        """Number of history slots"""
+        return self._history_count
+
+    @property
+    def event_names(self) -> list[EventName]:
+        """Names of events used by transitions"""
+        return list(self._events.keys())
+
+    @property
+    def coverage(self) -> typing.Optional['Coverage']:
+        """Active coverage collector"""
+        return self._coverage
+
+    def start_coverage(self) -> 'Coverage':
+        """Start collecting coverage
+
+        Coverage is collected for all statechart instances using this model.
+        If coverage collection is already started, existing collector is
+        returned.
+
+        """
+        if self._coverage is None:
+            self._coverage = Coverage(self)
+
+        return self._coverage
+
+    def stop_coverage(self):
+        """Stop collecting coverage"""
+        self._coverage = None
+
+    def get_state_index(self, name: StateName) -> StateIndex:
+        """Get state index"""
+        return self._indices[name]
+
+    def get_candidates(self,
+                       state: StateIndex,
+                       event: EventName
+                       ) -> tuple[CompiledTransition, ...]:
+        """Get candidate transitions ordered by priority
+
+        Candidate transitions include transitions defined by state and all
+        its ancestors whose event descriptors match event name. Result is
+        cached in state's dispatch table.
+
+        """
+        dispatch = self._states[state].dispatch
+        candidates = dispatch.get(event)
+        if candidates is not None:
+            return candidates
+
+        candidates = self._match(state, event)
+        if len(dispatch) < _dispatch_limit:
+            dispatch[event] = candidates
+
+        return candidates
+
+    def get_event(self, name: EventName) -> Event:
+        """Get event without payload
+
+        For all event names used by transitions, preallocated event instances
+        are returned.
+
+        """
+        event = self._events.get(name)
+        return event if event is not None else Event(name)
+
+    def _match(self, state, event):
+        tokens = event.split('.')
+        candidates = []
+
+        while state is not None:
+            compiled_state = self._states[state]
+            node = self._tries[state]
+
+            if node is not None:
+                positions = set(node.get(None, ()))
+                for token in tokens:
+                    node = node.get(token)
+                    if node is None:
+                        break
+                    positions.update(node.get(None, ()))
+
+                candidates.extend(compiled_state.transitions[i]
+                                  for i in sorted(positions))
+
+            state = compiled_state.parent
+
+        return tuple(candidates)
+
+
+class Coverage:
+    """Transition coverage collector
+
+    Coverage collector is created with `Model.start_coverage`. While
+    collector is active, each triggered transition (and each statechart
+    initialization) increments single counter associated with transition
+    index.
+
+    State entry counts are calculated from transition counts, based on
+    states entered by each transition. States entered by restoring history
+    are not known in advance - these entries are counted as entries of
+    history pseudo-state.
+
+    """
+
+    def __init__(self, model: Model):
+        self._model = model
+        self._transition_counts = [0] * len(model.transitions)
+        self._initial_count = 0
+
+    @property
+    def model(self) -> Model:
+        """Compiled model"""
+        return self._model
+
+    @property
+    def transition_counts(self) -> list[int]:
+        """Transition counts (indexed by transition index)"""
+        return self._transition_counts
+
+    @property
+    def initial_count(self) -> int:
+        """Number of statechart initializations"""
+        return self._initial_count
+
+    def get_state_counts(self) -> list[int]:
+        """Get state entry counts (indexed by state index)"""
+        counts = [0] * len(self._model.states)
+
+        for state in self._model.initial:
+            counts[state] += self._initial_count
+
+        for transition, count in zip(self._model.transitions,
+                                     self._transition_counts):
+            if not count:
+                continue
+
+            for state in transition.entries:
+                counts[state] += count
+
+            if transition.history is not None:
+                counts[transition.history] += count
+
+        return counts
+
+    def reset(self):
+        """Reset all counters"""
+        self._transition_counts = [0] * len(self._model.transitions)
+        self._initial_count = 0
+
+    def _on_initial(self):
+        self._initial_count += 1
+
+
+class ConditionProfiler:
+    """Condition evaluation profiler
+
+    Profiler wraps condition implementations with functions which record
+    number of evaluations, number of unsatisfied evaluations and evaluation
+    duration. Wrapped conditions should be used instead of original
+    conditions (e.g. during testing or in canary deployments).
+
+    Based on collected data, condition ranks usable by `Model` can be
+    calculated - conditions which are cheap and frequently unsatisfied are
+    ranked before expensive and frequently satisfied conditions.
+
+    """
+
+    def __init__(self, conditions: dict[ConditionName, Condition]):
+        self._stats = {name: [0, 0, 0.0] for name in conditions.keys()}
+        self._conditions = {name: self._wrap_condition(name, condition)
+                            for name, condition in conditions.items()}
+
+    @property
+    def conditions(self) -> dict[ConditionName, Condition]:
+        """Wrapped conditions"""
+        return self._conditions
+
+    def get_ranks(self) -> dict[ConditionName, float]:
+        """Get condition ranks
+
+        Rank of each condition is calculated as average evaluation duration
+        divided by probability of condition not being satisfied. Conditions
+        which were never evaluated are omitted.
+
+        """
+        ranks = {}
+        for name, (count, false_count, duration) in self._stats.items():
+            if not count:
+                continue
+
+            false_ratio = false_count / count
+            ranks[name] = ((duration / count) / false_ratio if false_ratio
+                           else math.inf)
+
+        return ranks
+
+    def _wrap_condition(self, name, condition):
+        stats = self._stats[name]
+
+        def wrapper(stc, event):
+            start = time.perf_counter()
+            result = condition(stc, event)
+            stats[2] += time.perf_counter() - start
+            stats[0] += 1
+            if not result:
+                stats[1] += 1
+            return result
+
+        return wrapper
+
+
+_dispatch_limit = 1024
+
+
+def _find_ancestor(source_path, target_path, internal):
+    source = source_path[-1]
+    target = target_path[-1]
+    ancestor = None
+
+    for i, j in zip(source_path, target_path):
+        if i != j:
+            break
+
+        if i == source or i == target:
+            if internal and i == source:
+                ancestor = i
+            break
+
+        ancestor = i
+
+    return ancestor
@@ -0,0 +1,271 @@
+"""Statechart monitoring and coverage reporting
+
+Monitor aggregates runtime data of all statechart instances sharing same
+compiled model. Aggregated data is maintained incrementally - each monitored
+step updates only counters associated with previous and current active state
+and triggered transition. Creating overlay (and its JSON or DOT
+representation) depends only on model size and not on number of monitored
+instances.
+
+Coverage collected by `hat.stc.Coverage` can be represented as heat map
+highlight of DOT graph.
+
+"""
+
+import colorsys
+import itertools
+import math
+import time
+import typing
+import weakref
+
+from hat.stc.common import EventName, StateName, Event
+from hat.stc.dot import DotHighlight
+from hat.stc.model import CompiledTransition, Model, Coverage
+from hat.stc.statechart import Statechart
+
+
+class StateOverlay(typing.NamedTuple):
+    """State runtime data"""
+    name: StateName
+    """State name"""
+    active: int
+    """Number of instances with this state active (including instances with
+    active descendant states)"""
+
+
+class TransitionOverlay(typing.NamedTuple):
+    """Transition runtime data"""
+    source: StateName
+    """Source state name"""
+    position: int
+    """Position of transition in source state's transitions"""
+    event: EventName
+    """Event descriptor"""
+    target: StateName | None
+    """Target state name"""
+    count: int
+    """Total number of triggered transitions"""
+    rate: float
+    """Number of triggered transitions per second since previous overlay"""
+
+
+class Overlay(typing.NamedTuple):
+    """Runtime data overlay"""
+    instances: int
+    """Number of monitored instances"""
+    states: list[StateOverlay]
+    """States (ordered by state index)"""
+    transitions: list[TransitionOverlay]
+    """Transitions (ordered by transition index)"""
+    duration: float
+    """Time (in seconds) since previous overlay"""
+
+
+class Monitor:
+    """Statechart monitor
+
+    Monitor is associated with single compiled model - only statecharts
+    using this model can be monitored. Monitored statecharts are registered
+    with `Monitor.register` and their events should be processed with
+    `Monitor.step` (instead of `Statechart.step`). Runners can be
+    initialized with monitor which is used for processing all events.
+    Events of statecharts which are not registered are processed without
+    updating monitor's data.
+
+    Monitor records active state of each registered statechart. If
+    registered statechart is migrated to other model (see
+    `Statechart.migrate`), it is unregistered during its next monitored
+    step. Statecharts are also unregistered once they are garbage
+    collected.
+
+    """
+
+    def __init__(self, model: Model):
+        self._model = model
+        self._entries = {}
+        self._active = [0] * len(model.states)
+        self._counts = [0] * len(model.transitions)
+        self._last_counts = list(self._counts)
+        self._last_time = time.monotonic()
+
+    @property
+    def model(self) -> Model:
+        """Compiled model"""
+        return self._model
+
+    def register(self, stc: Statechart):
+        """Start monitoring statechart"""
+        if stc.model is not self._model:
+            raise ValueError('model mismatch')
+
+        key = id(stc)
+        if key in self._entries:
+            return
+
+        state = stc.state_index
+        self._entries[key] = [weakref.ref(stc, lambda _: self._remove(key)),
+                              state]
+        if state is not None:
+            self._active[state] += 1
+
+    def unregister(self, stc: Statechart):
+        """Stop monitoring statechart"""
+        self._remove(id(stc))
+
+    def step(self,
+             stc: Statechart,
+             event: Event
+             ) -> CompiledTransition | None:
+        """Process single event of monitored statechart"""
+        entry = self._entries.get(id(stc))
+        if entry is None:
+            return stc.step(event)
+
+        if stc.model is not self._model:
+            self._remove(id(stc))
+            return stc.step(event)
+
+        transition = stc.step(event)
+        if transition is None:
+            return
+
+        self._counts[transition.index] += 1
+
+        state = entry[1]
+        next_state = stc.state_index
+        if next_state != state:
+            if state is not None:
+                self._active[state] -= 1
+            if next_state is not None:
+                self._active[next_state] += 1
+            entry[1] = next_state
+
+        return transition
+
+    def get_overlay(self) -> Overlay:
+        """Get current runtime data overlay
+
+        Transition rates are calculated based on number of triggered
+        transitions since previous call of this method.
+
+        """
+        now = time.monotonic()
+        duration = now - self._last_time
+        states = self._model.states
+
+        active = list(self._active)
+        for index in reversed(range(1, len(states))):
+            parent = states[index].parent
+            if parent is not None:
+                active[parent] += active[index]
+
+        counts = list(self._counts)
+        transitions = []
+        for state in states:
+            for position, transition in enumerate(state.transitions):
+                count = counts[transition.index]
+                delta = count - self._last_counts[transition.index]
+                transitions.append(TransitionOverlay(
+                    source=state.name,
+                    position=position,
+                    event=transition.event,
+                    target=(states[transition.target].name
+                            if transition.target is not None else None),
+                    count=count,
+                    rate=delta / duration if duration > 0 else 0.0))
+
+        self._last_counts = counts
+        self._last_time = now
+
+        return Overlay(
+            instances=len(self._entries),
+            states=[StateOverlay(name=state.name,
+                                 active=count)
+                    for state, count in zip(states, active)],
+            transitions=transitions,
+            duration=duration)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+
+        state = entry[1]
+        if state is not None:
+            self._active[state] -= 1
+
+
+def overlay_to_json(overlay: Overlay) -> dict:
+    """Create JSON serializable representation of overlay"""
+    return {'instances': overlay.instances,
+            'states': [state._asdict() for state in overlay.states],
+            'transitions': [transition._asdict()
+                            for transition in overlay.transitions],
+            'duration': overlay.duration}
+
+
+def overlay_to_dot_highlight(overlay: Overlay) -> DotHighlight:
+    """Create DOT highlight from overlay
+
+    States with active instances and transitions triggered since previous
+    overlay are highlighted. Resulting highlight can be used with
+    `hat.stc.create_dot_graph`.
+
+    """
+    states = {state.name: f'{state.active} active'
+              for state in overlay.states
+              if state.active}
+
+    transitions = {(transition.source, transition.position):
+                   f'{transition.rate:.1f}/s'
+                   for transition in overlay.transitions
+                   if transition.rate}
+
+    return DotHighlight(states=states,
+                        transitions=transitions)
+
+
+def coverage_to_dot_highlight(coverage: Coverage) -> DotHighlight:
+    """Create DOT heat map highlight from coverage
+
+    All states (except history pseudo-states) and transitions are annotated
+    with their entry and trigger counts. Highlight colors range from blue
+    (rarely used) to red (most frequently used) on logarithmic scale.
+    States and transitions which were never used are drawn gray.
+
+    """
+    model = coverage.model
+    state_counts = coverage.get_state_counts()
+    transition_counts = coverage.transition_counts
+    max_count = max(itertools.chain(state_counts, transition_counts),
+                    default=0)
+
+    states = {}
+    state_colors = {}
+    transitions = {}
+    transition_colors = {}
+
+    for state, count in zip(model.states, state_counts):
+        states[state.name] = str(count)
+        state_colors[state.name] = _get_heat_color(count, max_count)
+
+        for position, transition in enumerate(state.transitions):
+            count = transition_counts[transition.index]
+            key = state.name, position
+            transitions[key] = str(count)
+            transition_colors[key] = _get_heat_color(count, max_count)
+
+    return DotHighlight(states=states,
+                        transitions=transitions,
+                        state_colors=state_colors,
+                        transition_colors=transition_colors)
+
+
+def _get_heat_color(count, max_count):
+    if not count:
+        return '#a0a0a0'
+
+    ratio = math.log1p(count) / math.log1p(max_count)
+    r, g, b = colorsys.hsv_to_rgb((1 - ratio) * 2 / 3, 1, 0.9)
+    return f'#{round(r * 255):02x}{round(g * 255):02x}{round(b * 255):02x}'
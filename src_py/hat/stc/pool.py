@@ -0,0 +1,122 @@
+"""Event payload buffer pool
+
+Buffer pool provides reusable fixed size buffers for binary event payloads.
+Payloads acquired from pool are `memoryview` instances referencing prefix of
+pooled buffer.
+
+Payload acquired from pool is valid until it is released back to pool.
+Each payload keeps count of its references - payload is retained by each
+registration of event to runner configured with buffer pool and released
+after processing of that event (after `hat.stc.Statechart.step`,
+including all executed actions, returns). If event caused state change
+reported to runner's state changes callbacks, payload is released after
+these callbacks return. Buffer is returned to pool once all references
+are released, so same event can be registered multiple times (e.g.
+broadcast to multiple statecharts or forwarded by action to other
+statechart) to runners configured with same pool. Actions, conditions
+and callbacks should not keep references to payload after they return -
+if payload data is needed afterwards, it should be copied (e.g. with
+``bytes(event.payload)``).
+
+"""
+
+import collections
+
+
+class BufferPool:
+    """Payload buffer pool
+
+    Pool keeps at most `max_count` released buffers (if `max_count` is
+    ``None``, all released buffers are kept). If there are no released
+    buffers available, new buffer is allocated.
+
+    """
+
+    def __init__(self,
+                 buffer_size: int,
+                 max_count: int | None = None):
+        if buffer_size < 1:
+            raise ValueError('invalid buffer size')
+
+        self._buffer_size = buffer_size
+        self._max_count = max_count
+        self._buffers = collections.deque()
+
+    @property
+    def buffer_size(self) -> int:
+        """Buffer size"""
+        return self._buffer_size
+
+    def __len__(self) -> int:
+        return len(self._buffers)
+
+    def acquire(self, data: memoryview | bytes | bytearray) -> memoryview:
+        """Create payload containing copy of `data`"""
+        data = memoryview(data).cast('B')
+        size = len(data)
+        if size > self._buffer_size:
+            raise ValueError('buffer size exceeded')
+
+        buffer = (self._buffers.pop() if self._buffers
+                  else _Buffer(self._buffer_size))
+        buffer[:size] = data
+        buffer.refs = 0
+        return memoryview(buffer)[:size]
+
+    def retain(self, payload: object):
+        """Add payload reference
+
+        Each additional reference requires additional call of
+        `BufferPool.release` before buffer is returned to pool. If `payload`
+        is not acquired from buffer pool (or it is already released), this
+        method doesn't have any effect.
+
+        """
+        buffer = self._get_buffer(payload)
+        if buffer is None:
+            return
+
+        buffer.refs += 1
+
+    def release(self, payload: object):
+        """Release payload reference
+
+        Buffer is returned to pool once all references are released (payload
+        without references is released immediately). If `payload` is not
+        acquired from buffer pool (or it is already released), this method
+        doesn't have any effect.
+
+        """
+        buffer = self._get_buffer(payload)
+        if buffer is None:
+            return
+
+        if buffer.refs > 1:
+            buffer.refs -= 1
+            return
+
+        buffer.refs = -1
+        payload.release()
+        if self._max_count is None or len(self._buffers) < self._max_count:
+            self._buffers.append(buffer)
+
+    def _get_buffer(self, payload):
+        if type(payload) is not memoryview:
+            return
+
+        try:
+            buffer = payload.obj
+
+        except ValueError:
+            return
+
+        if (type(buffer) is not _Buffer or
+                len(buffer) != self._buffer_size or
+                buffer.refs < 0):
+            return
+
+        return buffer
+
+
+class _Buffer(bytearray):
+    __slots__ = ('refs',)
@@ -1,44 +1,588 @@
+from collections.abc import Callable, Iterable
 import asyncio
 import collections
+import functools
+import heapq
 import itertools
 import logging
+import time
+import typing
+import weakref
 
 from hat import aio
 
-from hat.stc.common import EventName, Event
-from hat.stc.statechart import Action, Condition, Statechart
+from hat.stc.common import EventName, Event, RegisterCallbackHandle
+from hat.stc.monitor import Monitor
+from hat.stc.model import Model
+from hat.stc.pool import BufferPool
+from hat.stc.statechart import (Action,
+                                Condition,
+                                StateChange,
+                                MigrationCb,
+                                Statechart,
+                                initialize_statecharts,
+                                migrate_statecharts)
 
 
 mlog = logging.getLogger(__name__)
 
 
+StateChangesCb: typing.TypeAlias = Callable[[list[StateChange]], None]
+"""Batched state changes callback"""
+
+
+class RunResult(typing.NamedTuple):
+    """Budgeted run result"""
+    processed: int
+    """Number of processed events"""
+    remaining: int
+    """Number of events remaining in queue"""
+
+
+class QueueMetrics(typing.NamedTuple):
+    """Event queue metrics (associated with single priority)"""
+    queued: int
+    """Number of currently queued events"""
+    processed: int
+    """Number of processed events"""
+    latency_sum: float
+    """Sum of processed events' queueing durations (in seconds)"""
+    latency_max: float
+    """Maximum processed event's queueing duration (in seconds)"""
+    missed_deadlines: int
+    """Number of events processed after their deadline"""
+
+
 class SyncRunner:
+    """Synchronous runner
 
-    def __init__(self):
-        self._queue = collections.deque()
+    Runner also provides timer service used by `SyncTimer`. Expired timers
+    are polled (and their events registered) at the beginning of each
+    `SyncRunner.step`, `SyncRunner.drain` and `SyncRunner.run` call, or
+    explicitly with `SyncRunner.poll_timers`. Timers are based on
+    `time.monotonic` clock.
+
+    Queued events are kept in per-statechart queues. `SyncRunner.step`,
+    `SyncRunner.drain` and `SyncRunner.run` without `max_instance_count`
+    process events in registration order. `SyncRunner.run` with
+    `max_instance_count` processes statecharts with queued events in
+    round-robin manner (see `SyncRunner.run`). In both cases, events of
+    single statechart are always processed in registration order.
+
+    """
+
+    def __init__(self,
+                 monitor: Monitor | None = None,
+                 pool: BufferPool | None = None):
+        self._order = collections.deque()
+        self._skips = {}
+        self._skip_count = 0
+        self._queues = {}
+        self._ready = collections.deque()
+        self._ready_stcs = set()
+        self._size = 0
+        self._monitor = monitor
+        self._pool = pool
+        self._changes_cbs = []
+        self._timers = []
+        self._cancelled_timers = 0
+        self._next_timer_seqs = itertools.count()
+        self._timer_slots = _TimerSlots(self._register_timer_event,
+                                        self._call_later)
 
     @property
     def empty(self) -> bool:
         """Is event queue empty"""
-        return not self._queue
+        return not self._size
+
+    @property
+    def next_timeout(self) -> float | None:
+        """Duration (in seconds) until earliest timer expiration
+
+        If there are no started timers, ``None`` is returned. Result can be
+        used by host loop for limiting duration of waiting for new events.
+
+        """
+        timers = self._timers
+        while timers and timers[0][2].cancelled:
+            heapq.heappop(timers)
+            self._cancelled_timers -= 1
+
+        if not timers:
+            return
+
+        return max(timers[0][0] - time.monotonic(), 0)
+
+    def poll_timers(self):
+        """Register events of expired timers"""
+        timers = self._timers
+        if not timers:
+            return
+
+        now = time.monotonic()
+        while timers and timers[0][0] <= now:
+            _, __, handle, cb, args = heapq.heappop(timers)
+            if handle.cancelled:
+                self._cancelled_timers -= 1
+                continue
+
+            handle.cancelled = True
+            cb(*args)
 
     def register(self, stc: Statechart, event: Event):
         """Add event to queue"""
-        self._queue.append((stc, event))
+        if self._pool is not None:
+            self._pool.retain(event.payload)
+
+        queue = self._queues.get(stc)
+        if queue is None:
+            queue = self._queues[stc] = collections.deque()
+            if stc not in self._ready_stcs:
+                self._ready.append(stc)
+                self._ready_stcs.add(stc)
+
+        queue.append(event)
+        self._order.append(stc)
+        self._size += 1
+
+    def create_timer(self,
+                     event: EventName,
+                     duration: float
+                     ) -> 'Timer':
+        """Create lightweight timer (see `Timer`)"""
+        return self._timer_slots.create_timer(event, duration, None)
+
+    def discard_timers(self, stc: Statechart):
+        """Stop all timers started by statechart"""
+        self._timer_slots.discard(stc)
+
+    def register_changes_cb(self,
+                            cb: StateChangesCb
+                            ) -> RegisterCallbackHandle:
+        """Register state changes callback
+
+        Callback is called with all state changes caused by single call of
+        `SyncRunner.step` or `SyncRunner.drain`.
+
+        """
+        return _register_cb(self._changes_cbs, cb)
 
     def step(self):
         """Process next queued event"""
-        if not self._queue:
+        if self._timers:
+            self.poll_timers()
+
+        if not self._size:
+            return
+
+        stc, event = self._pop()
+        if not self._changes_cbs:
+            _step(self._monitor, self._pool, stc, event)
             return
 
-        stc, event = self._queue.popleft()
-        stc.step(event)
+        changes = []
+        _observed_step(self._monitor, self._pool, stc, event, changes)
+        _notify_changes(self._changes_cbs, self._pool, changes)
+
+    def drain(self):
+        """Process queued events until queue is empty
+
+        Events registered during processing are also processed.
+
+        """
+        if self._timers:
+            self.poll_timers()
+
+        monitor = self._monitor
+        pool = self._pool
+
+        if not self._changes_cbs:
+            while self._size:
+                stc, event = self._pop()
+                _step(monitor, pool, stc, event)
+            return
+
+        changes = []
+        while self._size:
+            stc, event = self._pop()
+            _observed_step(monitor, pool, stc, event, changes)
+        _notify_changes(self._changes_cbs, self._pool, changes)
+
+    def run(self,
+            max_count: int | None = None,
+            max_duration: float | None = None,
+            max_instance_count: int | None = None,
+            check_interval: int = 64
+            ) -> RunResult:
+        """Process queued events within budget
+
+        Processing stops when queue is empty, when `max_count` events are
+        processed or when `max_duration` seconds elapse. Elapsed time is
+        checked only once every `check_interval` processed events.
+
+        If `max_instance_count` is provided, statecharts with queued events
+        are processed in round-robin manner - during its turn, at most
+        `max_instance_count` events of single statechart are processed,
+        so single statechart can not consume whole budget.
+
+        State changes callbacks are notified once, with all state changes
+        caused by this run.
+
+        """
+        if self._timers:
+            self.poll_timers()
+
+        monitor = self._monitor
+        pool = self._pool
+        changes = [] if self._changes_cbs else None
+        deadline = (time.monotonic() + max_duration
+                    if max_duration is not None else None)
+        count = 0
+
+        stc = None
+        queue = None
+        stc_count = 0
+
+        while self._size:
+            if max_count is not None and count >= max_count:
+                break
+
+            if (deadline is not None and count and
+                    not count % check_interval and
+                    time.monotonic() >= deadline):
+                break
+
+            if max_instance_count is None:
+                stc, event = self._pop()
+
+            else:
+                if not queue or stc_count >= max_instance_count:
+                    if stc is not None:
+                        self._end_turn(stc, queue, False)
+
+                    stc = self._ready.popleft()
+                    queue = self._queues.get(stc)
+                    stc_count = 0
+                    if not queue:
+                        self._ready_stcs.discard(stc)
+                        stc = None
+                        continue
+
+                event = queue.popleft()
+                stc_count += 1
+                self._size -= 1
+                self._skip(stc)
+
+            if changes is None:
+                _step(monitor, pool, stc, event)
+
+            else:
+                _observed_step(monitor, pool, stc, event, changes)
+
+            count += 1
+
+        if max_instance_count is not None and stc is not None:
+            self._end_turn(stc, queue, stc_count < max_instance_count)
+
+        if changes:
+            _notify_changes(self._changes_cbs, self._pool, changes)
+
+        return RunResult(processed=count,
+                         remaining=self._size)
+
+    def _pop(self):
+        order = self._order
+        skips = self._skips
+
+        while True:
+            stc = order.popleft()
+            if not skips:
+                break
+
+            skip = skips.get(stc)
+            if not skip:
+                break
+
+            if skip > 1:
+                skips[stc] = skip - 1
+
+            else:
+                del skips[stc]
+
+            self._skip_count -= 1
+
+        queue = self._queues[stc]
+        event = queue.popleft()
+        self._size -= 1
+
+        if not queue:
+            del self._queues[stc]
+            if not self._queues:
+                self._ready.clear()
+                self._ready_stcs.clear()
+
+            elif len(self._ready) > 2 * len(self._queues) + 64:
+                self._ready = collections.deque(
+                    i for i in self._ready if i in self._queues)
+                self._ready_stcs = set(self._ready)
+
+        return stc, event
+
+    def _skip(self, stc):
+        if not self._size:
+            self._order.clear()
+            self._skips.clear()
+            self._skip_count = 0
+            return
+
+        self._skips[stc] = self._skips.get(stc, 0) + 1
+        self._skip_count += 1
+        if self._skip_count <= self._size + 64:
+            return
+
+        order = collections.deque()
+        skips = self._skips
+        for i in self._order:
+            skip = skips.get(i)
+            if skip:
+                skips[i] = skip - 1
+
+            else:
+                order.append(i)
+
+        self._order = order
+        self._skips = {}
+        self._skip_count = 0
+
+    def _end_turn(self, stc, queue, resume):
+        if not queue:
+            self._queues.pop(stc, None)
+            self._ready_stcs.discard(stc)
+            if not self._queues:
+                self._ready.clear()
+                self._ready_stcs.clear()
+
+        elif resume:
+            self._ready.appendleft(stc)
+
+        else:
+            self._ready.append(stc)
+
+    def _call_later(self, delay, cb, *args):
+        handle = _SyncTimerHandle(self)
+        heapq.heappush(self._timers, (time.monotonic() + delay,
+                                      next(self._next_timer_seqs),
+                                      handle, cb, args))
+        return handle
+
+    def _on_timer_cancel(self):
+        self._cancelled_timers += 1
+        if self._cancelled_timers * 2 <= len(self._timers):
+            return
+
+        self._timers = [i for i in self._timers if not i[2].cancelled]
+        heapq.heapify(self._timers)
+        self._cancelled_timers = 0
+
+    def _register_timer_event(self, stc, event, _):
+        self.register(stc, event)
+
+
+class MailboxRunner:
+    """Synchronous runner with statechart mailboxes
+
+    Instead of single event queue, runner keeps separate mailbox for each
+    statechart with pending events and list of statecharts with pending
+    events (ready list). Statecharts from ready list are processed in
+    round-robin manner - all events available in statechart's mailbox are
+    processed in single batch.
+
+    Mailbox size can be limited for all statecharts with `mailbox_size` or
+    for single statechart with `MailboxRunner.set_mailbox_size`. Events
+    exceeding mailbox size are discarded.
+
+    If `pool` is provided, payload of each event is retained during event
+    registration and released after event is processed (see
+    `hat.stc.BufferPool`). Payloads of events which caused state changes
+    are released after state changes callbacks are notified.
+
+    """
+
+    def __init__(self,
+                 monitor: Monitor | None = None,
+                 mailbox_size: int | None = None,
+                 pool: BufferPool | None = None):
+        self._monitor = monitor
+        self._mailbox_size = mailbox_size
+        self._pool = pool
+        self._mailbox_sizes = weakref.WeakKeyDictionary()
+        self._mailboxes = {}
+        self._ready = collections.deque()
+        self._changes_cbs = []
+
+    @property
+    def empty(self) -> bool:
+        """Are all mailboxes empty"""
+        return not self._ready
+
+    def set_mailbox_size(self,
+                         stc: Statechart,
+                         mailbox_size: int | None):
+        """Set mailbox size limit of single statechart
+
+        Provided size overrides runner's default mailbox size. If
+        `mailbox_size` is ``None``, statechart's mailbox is not limited.
+
+        """
+        self._mailbox_sizes[stc] = mailbox_size
+
+    def register(self,
+                 stc: Statechart,
+                 event: Event
+                 ) -> bool:
+        """Add event to statechart's mailbox
+
+        If mailbox is full, event is discarded and ``False`` is returned.
+
+        """
+        mailbox = self._mailboxes.get(stc)
+        size = (self._mailbox_sizes.get(stc, self._mailbox_size)
+                if self._mailbox_sizes else self._mailbox_size)
+
+        if size is not None and (len(mailbox) if mailbox else 0) >= size:
+            return False
+
+        if self._pool is not None:
+            self._pool.retain(event.payload)
+
+        if mailbox is None:
+            mailbox = self._mailboxes[stc] = collections.deque()
+            self._ready.append(stc)
+
+        mailbox.append(event)
+        return True
+
+    def register_changes_cb(self,
+                            cb: StateChangesCb
+                            ) -> RegisterCallbackHandle:
+        """Register state changes callback
+
+        Callback is called with all state changes caused by single call of
+        `MailboxRunner.step` or `MailboxRunner.drain`.
+
+        """
+        return _register_cb(self._changes_cbs, cb)
+
+    def step(self):
+        """Process pending events of next statechart from ready list"""
+        if not self._ready:
+            return
+
+        changes = [] if self._changes_cbs else None
+        self._process(self._ready.popleft(), changes)
+
+        if changes:
+            _notify_changes(self._changes_cbs, self._pool, changes)
+
+    def drain(self):
+        """Process pending events until all mailboxes are empty
+
+        Events registered during processing are also processed.
+
+        """
+        ready = self._ready
+        changes = [] if self._changes_cbs else None
+
+        while ready:
+            self._process(ready.popleft(), changes)
+
+        if changes:
+            _notify_changes(self._changes_cbs, self._pool, changes)
+
+    def _process(self, stc, changes):
+        mailbox = self._mailboxes[stc]
+        monitor = self._monitor
+        pool = self._pool
+        count = len(mailbox)
+
+        try:
+            if changes is not None:
+                for _ in range(count):
+                    _observed_step(monitor, pool, stc, mailbox.popleft(),
+                                   changes)
+
+            elif pool is not None:
+                for _ in range(count):
+                    _step(monitor, pool, stc, mailbox.popleft())
+
+            else:
+                if monitor is not None:
+                    step = functools.partial(monitor.step, stc)
+
+                else:
+                    step = stc.step
+
+                pop = mailbox.popleft
+                for _ in range(count):
+                    step(pop())
+
+        finally:
+            if mailbox:
+                self._ready.append(stc)
+
+            else:
+                del self._mailboxes[stc]
 
 
 class AsyncRunner(aio.Resource):
+    """Asynchronous runner
 
-    def __init__(self):
-        self._queue = aio.Queue()
+    Runner's event queue consists of `priority_count` priority levels
+    (priority ``0`` is highest). Events are always processed from highest
+    non empty priority level. Priority of each event can be provided during
+    event registration - if it is not provided, priority associated with
+    event name in `priorities` is used (lowest priority by default).
+
+    Events can be registered with optional deadline - maximum duration (in
+    seconds) that event should spend in queue. Within single priority level,
+    events with deadlines are processed (ordered by deadline) before events
+    without deadlines. Events are processed even if their deadline is
+    missed.
+
+    Runner returns control to event loop after each `batch_size` processed
+    events, allowing timers and other tasks to register new events.
+
+    If `pool` is provided, payload of each event is retained during event
+    registration and released after event is processed (see
+    `hat.stc.BufferPool`). Payloads of events which caused state changes
+    are released after state changes callbacks are notified.
+
+    """
+
+    def __init__(self,
+                 monitor: Monitor | None = None,
+                 priority_count: int = 1,
+                 priorities: dict[EventName, int] = {},
+                 batch_size: int = 1024,
+                 pool: BufferPool | None = None):
+        if priority_count < 1:
+            raise ValueError('invalid priority count')
+
+        if any(not (0 <= i < priority_count) for i in priorities.values()):
+            raise ValueError('invalid priority')
+
+        self._monitor = monitor
+        self._pool = pool
+        self._priority_count = priority_count
+        self._priorities = priorities
+        self._batch_size = batch_size
+        self._levels = [_Level() for _ in range(priority_count)]
+        self._size = 0
+        self._next_seqs = itertools.count()
+        self._data_event = asyncio.Event()
+        self._changes_cbs = []
+        self._timer_slots = _TimerSlots(self._register_timer_event,
+                                        self._call_later)
         self._async_group = aio.Group()
 
         self.async_group.spawn(self._runner_loop)
@@ -48,22 +592,188 @@ class AsyncRunner(aio.Resource):
         """Async group"""
         return self._async_group
 
-    def register(self, stc: Statechart, event: Event):
+    @property
+    def priority_count(self) -> int:
+        """Number of priority levels"""
+        return self._priority_count
+
+    def register(self,
+                 stc: Statechart,
+                 event: Event,
+                 priority: int | None = None,
+                 deadline: float | None = None):
         """Add event to queue"""
-        self._queue.put_nowait((stc, event))
+        if not self.is_open:
+            raise aio.QueueClosedError()
+
+        if priority is None:
+            priority = self._priorities.get(event.name,
+                                            self._priority_count - 1)
+
+        elif not (0 <= priority < self._priority_count):
+            raise ValueError('invalid priority')
+
+        if self._pool is not None:
+            self._pool.retain(event.payload)
+
+        level = self._levels[priority]
+        now = time.monotonic()
+
+        if deadline is None:
+            level.queue.append((stc, event, now))
+
+        else:
+            heapq.heappush(level.deadlines, (now + deadline,
+                                             next(self._next_seqs),
+                                             stc, event, now))
+
+        self._size += 1
+        self._data_event.set()
+
+    def create_timer(self,
+                     event: EventName,
+                     duration: float,
+                     priority: int | None = 0
+                     ) -> 'Timer':
+        """Create lightweight timer (see `Timer`)
+
+        Timer events are registered with `priority`.
+
+        """
+        return self._timer_slots.create_timer(event, duration, priority)
+
+    def discard_timers(self, stc: Statechart):
+        """Stop all timers started by statechart"""
+        self._timer_slots.discard(stc)
+
+    def get_metrics(self) -> list[QueueMetrics]:
+        """Get event queue metrics (indexed by priority)"""
+        return [QueueMetrics(queued=len(level.queue) + len(level.deadlines),
+                             processed=level.processed,
+                             latency_sum=level.latency_sum,
+                             latency_max=level.latency_max,
+                             missed_deadlines=level.missed_deadlines)
+                for level in self._levels]
+
+    def register_changes_cb(self,
+                            cb: StateChangesCb
+                            ) -> RegisterCallbackHandle:
+        """Register state changes callback
+
+        Callback is called with all state changes caused by processing of
+        all events available in queue at once.
+
+        """
+        return _register_cb(self._changes_cbs, cb)
+
+    async def initialize(self,
+                         statecharts: Iterable[Statechart],
+                         batch_size: int = 1024):
+        """Enter initial state of statecharts created without initialization
+
+        Statecharts are initialized (see `hat.stc.initialize_statecharts`) in
+        batches of `batch_size` statecharts. Between batches, control is
+        returned to event loop so that event processing is not paused for
+        duration of whole initialization. Statecharts should be registered
+        with monitor only after their initialization.
+
+        """
+        statecharts = iter(statecharts)
+        while True:
+            batch = list(itertools.islice(statecharts, batch_size))
+            if not batch:
+                break
+
+            initialize_statecharts(batch)
+            await asyncio.sleep(0)
+
+    async def migrate(self,
+                      statecharts: Iterable[Statechart],
+                      model: Model,
+                      migration_cb: MigrationCb | None = None,
+                      batch_size: int = 1024):
+        """Replace model of multiple statecharts
+
+        Statecharts are migrated (see `Statechart.migrate`) in batches of
+        `batch_size` statecharts. Between batches, control is returned to
+        event loop so that event processing is not paused for duration of
+        whole migration.
+
+        """
+        statecharts = iter(statecharts)
+        while True:
+            batch = list(itertools.islice(statecharts, batch_size))
+            if not batch:
+                break
+
+            migrate_statecharts(batch, model, migration_cb)
+            await asyncio.sleep(0)
 
     async def _runner_loop(self):
         try:
             while True:
-                stc, event = await self._queue.get()
-                stc.step(event)
+                if not self._size:
+                    self._data_event.clear()
+                    await self._data_event.wait()
+                    continue
+
+                count = 0
+                changes = [] if self._changes_cbs else None
+
+                while self._size and count < self._batch_size:
+                    stc, event = self._pop()
+                    count += 1
+
+                    if changes is None:
+                        _step(self._monitor, self._pool, stc, event)
+
+                    else:
+                        _observed_step(self._monitor, self._pool, stc, event,
+                                       changes)
+
+                if changes:
+                    _notify_changes(self._changes_cbs, self._pool, changes)
+
+                await asyncio.sleep(0)
 
         except Exception as e:
             mlog.error("runner loop error: %s", e, exc_info=e)
 
         finally:
             self.close()
-            self._queue.close()
+
+    def _call_later(self, delay, cb, *args):
+        return asyncio.get_running_loop().call_later(delay, cb, *args)
+
+    def _register_timer_event(self, stc, event, priority):
+        if not self.is_open:
+            return
+
+        self.register(stc, event, priority=priority)
+
+    def _pop(self):
+        for level in self._levels:
+            if level.deadlines:
+                deadline, _, stc, event, registered = heapq.heappop(
+                    level.deadlines)
+                break
+
+            if level.queue:
+                deadline = None
+                stc, event, registered = level.queue.popleft()
+                break
+
+        now = time.monotonic()
+        latency = now - registered
+        level.processed += 1
+        level.latency_sum += latency
+        if latency > level.latency_max:
+            level.latency_max = latency
+        if deadline is not None and now > deadline:
+            level.missed_deadlines += 1
+
+        self._size -= 1
+        return stc, event
 
 
 class AsyncTimer(aio.Resource):
@@ -71,10 +781,12 @@ class AsyncTimer(aio.Resource):
     def __init__(self,
                  runner: AsyncRunner,
                  event: EventName,
-                 duration: float):
+                 duration: float,
+                 priority: int | None = 0):
         self._runner = runner
         self._event = event
         self._duration = duration
+        self._priority = priority
         self._loop = asyncio.get_running_loop()
         self._async_group = runner.async_group.create_subgroup()
         self._next_tokens = itertools.count(1)
@@ -126,4 +838,258 @@ class AsyncTimer(aio.Resource):
             return
 
         self._runner.register(stc, Event(name=self._event,
-                                         payload=token))
+                                         payload=token),
+                              priority=self._priority)
+
+
+class SyncTimer:
+    """Timer driven by `SyncRunner`
+
+    Timer provides same actions and condition as `AsyncTimer` without
+    requiring asyncio event loop. Timer events are registered to runner
+    when runner polls expired timers.
+
+    Timer is based on runner's lightweight timer (see
+    `SyncRunner.create_timer`) - its slot is released once timer is garbage
+    collected.
+
+    """
+
+    def __init__(self,
+                 runner: SyncRunner,
+                 event: EventName,
+                 duration: float):
+        self._timer = runner.create_timer(event, duration)
+        weakref.finalize(self, self._timer.close)
+
+    @property
+    def start(self) -> Action:
+        return self._timer.start
+
+    @property
+    def stop(self) -> Action:
+        return self._timer.stop
+
+    @property
+    def condition(self) -> Condition:
+        return self._timer.condition
+
+
+class Timer:
+    """Lightweight timer
+
+    Timer is created with runner's ``create_timer`` method and provides same
+    actions and condition as `AsyncTimer`. Timers created by same runner
+    share runner's timer state arrays - each timer only references its slot
+    in these arrays. Timer which is not needed anymore should be closed,
+    which enables reuse of its slot.
+
+    All timers started by single statechart can be stopped at once with
+    runner's ``discard_timers`` method (e.g. when statechart is discarded).
+
+    """
+
+    __slots__ = ('_slots', '_slot')
+
+    def __init__(self, slots: '_TimerSlots', slot: int):
+        self._slots = slots
+        self._slot = slot
+
+    @property
+    def start(self) -> Action:
+        return self._start
+
+    @property
+    def stop(self) -> Action:
+        return self._stop
+
+    @property
+    def condition(self) -> Condition:
+        return self._condition
+
+    def close(self):
+        """Stop timer and release its slot"""
+        if self._slot is None:
+            return
+
+        self._slots.release(self._slot)
+        self._slot = None
+
+    def _start(self, stc, _):
+        if self._slot is not None:
+            self._slots.start(self._slot, stc)
+
+    def _stop(self, _, __):
+        if self._slot is not None:
+            self._slots.stop(self._slot)
+
+    def _condition(self, _, event):
+        return bool(self._slot is not None and event and
+                    event.payload == self._slots.tokens[self._slot])
+
+
+class _TimerSlots:
+
+    def __init__(self, register, call_later):
+        self._register = register
+        self._call_later = call_later
+        self._next_tokens = itertools.count(1)
+        self._free = []
+        self.events = []
+        self.durations = []
+        self.priorities = []
+        self.tokens = []
+        self.stcs = []
+        self.handles = []
+        self._stc_slots = {}
+
+    def create_timer(self, event, duration, priority):
+        if self._free:
+            slot = self._free.pop()
+            self.events[slot] = event
+            self.durations[slot] = duration
+            self.priorities[slot] = priority
+
+        else:
+            slot = len(self.events)
+            self.events.append(event)
+            self.durations.append(duration)
+            self.priorities.append(priority)
+            self.tokens.append(None)
+            self.stcs.append(None)
+            self.handles.append(None)
+
+        return Timer(self, slot)
+
+    def release(self, slot):
+        self.stop(slot)
+        self.events[slot] = None
+        self._free.append(slot)
+
+    def start(self, slot, stc):
+        self.stop(slot)
+
+        token = next(self._next_tokens)
+        self.tokens[slot] = token
+        self.stcs[slot] = stc
+        self.handles[slot] = self._call_later(self.durations[slot],
+                                              self._on_timer, slot, token)
+
+        stc_slots = self._stc_slots.get(stc)
+        if stc_slots is None:
+            stc_slots = self._stc_slots[stc] = set()
+        stc_slots.add(slot)
+
+    def stop(self, slot):
+        stc = self.stcs[slot]
+        if stc is None:
+            return
+
+        stc_slots = self._stc_slots[stc]
+        stc_slots.discard(slot)
+        if not stc_slots:
+            del self._stc_slots[stc]
+
+        self._stop(slot)
+
+    def discard(self, stc):
+        for slot in self._stc_slots.pop(stc, ()):
+            self._stop(slot)
+
+    def _stop(self, slot):
+        handle = self.handles[slot]
+        if handle is not None:
+            handle.cancel()
+
+        self.tokens[slot] = None
+        self.stcs[slot] = None
+        self.handles[slot] = None
+
+    def _on_timer(self, slot, token):
+        if self.tokens[slot] != token:
+            return
+
+        self.handles[slot] = None
+        self._register(self.stcs[slot],
+                       Event(name=self.events[slot],
+                             payload=token),
+                       self.priorities[slot])
+
+
+class _SyncTimerHandle:
+
+    __slots__ = ('_runner', 'cancelled')
+
+    def __init__(self, runner):
+        self._runner = runner
+        self.cancelled = False
+
+    def cancel(self):
+        if self.cancelled:
+            return
+
+        self.cancelled = True
+        self._runner._on_timer_cancel()
+
+
+class _Level:
+
+    def __init__(self):
+        self.queue = collections.deque()
+        self.deadlines = []
+        self.processed = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.missed_deadlines = 0
+
+
+def _step(monitor, pool, stc, event):
+    try:
+        if monitor is not None:
+            return monitor.step(stc, event)
+
+        return stc.step(event)
+
+    finally:
+        if pool is not None:
+            pool.release(event.payload)
+
+
+def _observed_step(monitor, pool, stc, event, changes):
+    state = stc.state_index
+    transition = None
+
+    try:
+        transition = _step(monitor, None, stc, event)
+
+    finally:
+        if pool is not None and transition is None:
+            pool.release(event.payload)
+
+    if transition is None:
+        return
+
+    changes.append(StateChange(statechart=stc,
+                               source=state,
+                               target=stc.state_index,
+                               event=event))
+
+
+def _notify_changes(cbs, pool, changes):
+    if not changes:
+        return
+
+    try:
+        for cb in list(cbs):
+            cb(changes)
+
+    finally:
+        if pool is not None:
+            for change in changes:
+                pool.release(change.event.payload)
+
+
+def _register_cb(cbs, cb):
+    cbs.append(cb)
+    return RegisterCallbackHandle(
+        lambda: cbs.remove(cb) if cb in cbs else None)
@@ -1,37 +1,87 @@
 """Statechart module"""
 
 import itertools
+import os
+import pathlib
 import typing
 import xml.etree.ElementTree
 
-from hat.stc.common import State, Transition
+from hat.stc.common import HistoryType, State, Transition
 
 
-def parse_scxml(scxml: typing.TextIO) -> list[State]:
-    """Parse SCXML into list of state definitions"""
+def parse_scxml(scxml: typing.TextIO | os.PathLike | str,
+                base_dir: pathlib.Path | None = None
+                ) -> list[State]:
+    """Parse SCXML into list of state definitions
+
+    State element can reference external SCXML document with ``src``
+    attribute. States defined by referenced document are added as first
+    children of referencing state. Names of these states (and targets of
+    their transitions) are prefixed with referencing state's name
+    (``<state>.<name>``). Referencing state's ``initial`` attribute can
+    reference both included and inline children - if it is not provided,
+    initial state of referenced document is used.
+
+    Relative ``src`` paths are resolved based on `base_dir`. If `base_dir`
+    is not provided, directory of `scxml` file (provided as path or as file
+    object with file name) is used (or current working directory if `scxml`
+    doesn't have file name). Paths referenced by included documents are
+    resolved based on including document's directory.
+
+    Each referenced document is parsed only once - parsed states are cached
+    and reused by all subsequent calls (until modification time of
+    referenced document, or of any document it references, changes).
+
+    """
+    if base_dir is None:
+        name = (scxml if isinstance(scxml, (str, os.PathLike))
+                else getattr(scxml, 'name', None))
+        base_dir = (pathlib.Path(name).parent
+                    if isinstance(name, (str, os.PathLike))
+                    else pathlib.Path('.'))
+
     root_el = _read_xml(scxml)
-    return _parse_scxml_states(root_el)
+    return _parse_scxml_states(root_el, base_dir, (), {})
 
 
-def _parse_scxml_states(parent_el):
-    states = {}
+def _parse_scxml_states(parent_el, base_dir, includes, dependencies,
+                        included=[]):
+    states = {state.name: state for state in included}
     for state_el in itertools.chain(parent_el.findall("./state"),
-                                    parent_el.findall("./final")):
-        state = _parse_scxml_state(state_el)
+                                    parent_el.findall("./final"),
+                                    parent_el.findall("./history")):
+        state = _parse_scxml_state(state_el, base_dir, includes,
+                                   dependencies)
         states[state.name] = state
 
     if not states:
         return []
 
     initial = parent_el.get('initial')
+    if initial is None and included:
+        initial = included[0].name
+
     return [states[initial], *(state for name, state in states.items()
                                if name != initial)]
 
 
-def _parse_scxml_state(state_el):
+def _parse_scxml_state(state_el, base_dir, includes, dependencies):
+    if state_el.tag == 'history':
+        return State(
+            name=state_el.get('id'),
+            history=HistoryType(state_el.get('type') or 'shallow'))
+
+    name = state_el.get('id')
+    src = state_el.get('src')
+    included = (_include_scxml_states(base_dir / src, name, includes,
+                                      dependencies)
+                if src else [])
+    children = _parse_scxml_states(state_el, base_dir, includes,
+                                   dependencies, included)
+
     return State(
-        name=state_el.get('id'),
-        children=_parse_scxml_states(state_el),
+        name=name,
+        children=children,
         transitions=[_parse_scxml_transition(i)
                      for i in state_el.findall('./transition')],
         entries=[entry_el.text
@@ -55,6 +105,56 @@ def _parse_scxml_transition(transition_el):
         internal=transition_el.get('type') == 'internal')
 
 
+def _include_scxml_states(path, prefix, includes, dependencies):
+    path = path.resolve()
+    if path in includes:
+        raise ValueError(f'recursive include {path}')
+
+    cached = _fragments.get(path)
+    if cached and all(_get_mtime(i) == mtime
+                      for i, mtime in cached[0].items()):
+        fragment_dependencies, states = cached
+
+    else:
+        fragment_dependencies = {path: path.stat().st_mtime_ns}
+        with open(path, encoding='utf-8') as f:
+            root_el = _read_xml(f)
+
+        states = _parse_scxml_states(root_el, path.parent, (*includes, path),
+                                     fragment_dependencies)
+        _fragments[path] = fragment_dependencies, states
+
+    dependencies.update(fragment_dependencies)
+
+    names = set()
+    stack = list(states)
+    while stack:
+        state = stack.pop()
+        names.add(state.name)
+        stack.extend(state.children)
+
+    return [_prefix_state(state, prefix, names) for state in states]
+
+
+def _prefix_state(state, prefix, names):
+    return state._replace(
+        name=f'{prefix}.{state.name}',
+        children=[_prefix_state(child, prefix, names)
+                  for child in state.children],
+        transitions=[
+            transition._replace(target=f'{prefix}.{transition.target}')
+            if transition.target in names else transition
+            for transition in state.transitions])
+
+
+def _get_mtime(path):
+    try:
+        return path.stat().st_mtime_ns
+
+    except OSError:
+        return
+
+
 def _read_xml(source):
     it = xml.etree.ElementTree.iterparse(source)
     for _, el in it:
@@ -64,3 +164,7 @@ def _read_xml(source):
             el.tag = postfix
 
     return it.root
+
+
+_fragments: dict[pathlib.Path,
+                 tuple[dict[pathlib.Path, int], list[State]]] = {}
@@ -0,0 +1,276 @@
+"""Shared memory event transport
+
+Events are transferred between processes through fixed size ring of event
+slots placed in `multiprocessing.shared_memory.SharedMemory` block. Each slot
+contains statechart instance identifier, event identifier (index of event
+name in interned event names list shared by all participants) and offset
+and length of optional payload. Event payloads are restricted to bytes-like
+objects which are copied into payload area associated with slot.
+
+Ring supports single producer and single consumer. Producer and consumer
+synchronize only by reading and writing ring's head and tail counters - no
+locks, pickling or system calls are used for each event.
+
+"""
+
+from collections.abc import Callable, Iterable, Mapping
+import multiprocessing.shared_memory
+import struct
+import typing
+import zlib
+
+from hat.stc.common import EventName, Event
+from hat.stc.pool import BufferPool
+from hat.stc.statechart import Statechart
+
+
+InstanceId: typing.TypeAlias = int
+"""Statechart instance identifier (unsigned 32-bit integer)"""
+
+InstanceResolver: typing.TypeAlias = (Mapping[InstanceId, Statechart] |
+                                      Callable[[InstanceId],
+                                               Statechart | None])
+"""Mapping or function resolving instance identifiers to statecharts"""
+
+
+def create_event_ring(event_names: Iterable[EventName],
+                      slot_count: int = 1024,
+                      payload_size: int = 1024,
+                      name: str | None = None
+                      ) -> 'EventRing':
+    """Create new shared memory event ring
+
+    `event_names` should contain all event names which can be transferred
+    by this ring (e.g. `hat.stc.Model.event_names`). Consumer should connect
+    to ring with identical list of event names.
+
+    Each event payload is limited to `payload_size` bytes. Payloads are
+    addressed with 32-bit offsets - total size of slots and payloads should
+    not exceed 4 GiB (otherwise `ValueError` is raised).
+
+    """
+    event_names = list(event_names)
+    if not (1 <= slot_count <= _max_u32):
+        raise ValueError('invalid slot count')
+
+    if not (0 <= payload_size < _no_payload):
+        raise ValueError('invalid payload size')
+
+    if (_header.size + slot_count * _slot.size +
+            (slot_count - 1) * payload_size > _max_u32):
+        raise ValueError('ring size exceeded')
+
+    size = (_header.size +
+            slot_count * _slot.size +
+            slot_count * payload_size)
+    shm = multiprocessing.shared_memory.SharedMemory(name=name,
+                                                     create=True,
+                                                     size=size)
+    _header.pack_into(shm.buf, 0, 0, 0, slot_count, payload_size,
+                      _calculate_names_checksum(event_names))
+
+    return EventRing(shm, event_names)
+
+
+def connect_event_ring(name: str,
+                       event_names: Iterable[EventName]
+                       ) -> 'EventRing':
+    """Connect to existing shared memory event ring"""
+    event_names = list(event_names)
+    shm = multiprocessing.shared_memory.SharedMemory(name=name)
+
+    _, __, ___, ____, checksum = _header.unpack_from(shm.buf, 0)
+    if checksum != _calculate_names_checksum(event_names):
+        shm.close()
+        raise ValueError('event names mismatch')
+
+    return EventRing(shm, event_names)
+
+
+class EventRing:
+    """Shared memory event ring
+
+    For creating new instance of this class see `create_event_ring` or
+    `connect_event_ring`.
+
+    """
+
+    def __init__(self,
+                 shm: multiprocessing.shared_memory.SharedMemory,
+                 event_names: list[EventName]):
+        _, __, slot_count, payload_size, ___ = _header.unpack_from(shm.buf, 0)
+
+        self._shm = shm
+        self._buf = shm.buf
+        self._slot_count = slot_count
+        self._payload_size = payload_size
+        self._slots_offset = _header.size
+        self._payloads_offset = _header.size + slot_count * _slot.size
+        self._event_ids = {name: i for i, name in enumerate(event_names)}
+        self._events = [Event(name) for name in event_names]
+
+    @property
+    def name(self) -> str:
+        """Shared memory block name"""
+        return self._shm.name
+
+    @property
+    def slot_count(self) -> int:
+        """Number of event slots"""
+        return self._slot_count
+
+    @property
+    def payload_size(self) -> int:
+        """Maximum event payload size"""
+        return self._payload_size
+
+    def __len__(self) -> int:
+        head, tail = _counters.unpack_from(self._buf, 0)
+        return head - tail
+
+    def close(self):
+        """Close access to shared memory block"""
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self):
+        """Request destruction of shared memory block"""
+        self._shm.unlink()
+
+    def put(self,
+            instance_id: InstanceId,
+            event: Event
+            ) -> bool:
+        """Add event to ring (producer only)
+
+        If ring is full, event is not added and ``False`` is returned.
+        Instance identifier should be unsigned 32-bit integer (otherwise
+        `ValueError` is raised).
+
+        """
+        if not (0 <= instance_id <= _max_u32):
+            raise ValueError('invalid instance id')
+
+        event_id = self._event_ids.get(event.name)
+        if event_id is None:
+            raise ValueError(f'event {event.name} not interned')
+
+        head, tail = _counters.unpack_from(self._buf, 0)
+        if head - tail >= self._slot_count:
+            return False
+
+        index = head % self._slot_count
+        payload_offset = self._payloads_offset + index * self._payload_size
+
+        if event.payload is None:
+            payload_length = _no_payload
+
+        else:
+            payload = memoryview(event.payload).cast('B')
+            payload_length = len(payload)
+            if payload_length > self._payload_size:
+                raise ValueError('payload size exceeded')
+
+            self._buf[payload_offset:payload_offset+payload_length] = payload
+
+        _slot.pack_into(self._buf, self._slots_offset + index * _slot.size,
+                        instance_id, event_id, payload_offset, payload_length)
+        _head.pack_into(self._buf, 0, head + 1)
+        return True
+
+    def get(self,
+            pool: BufferPool | None = None
+            ) -> tuple[InstanceId, Event] | None:
+        """Get next event from ring (consumer only)
+
+        Event payloads are returned as `bytes` copies of payload area. If
+        `pool` is provided, payloads are copied to buffers acquired from pool
+        instead. If ring is empty, ``None`` is returned.
+
+        """
+        head, tail = _counters.unpack_from(self._buf, 0)
+        if head == tail:
+            return
+
+        result = self._read_slot(tail % self._slot_count, pool)
+        _tail.pack_into(self._buf, _head.size, tail + 1)
+        return result
+
+    def drain(self,
+              runner,
+              instances: InstanceResolver,
+              max_count: int | None = None,
+              pool: BufferPool | None = None
+              ) -> int:
+        """Register available events with runner (consumer only)
+
+        Runner can be any object providing ``register(stc, event)`` method
+        (e.g. `hat.stc.SyncRunner` or `hat.stc.AsyncRunner`). Statechart
+        instances are resolved based on instance identifiers with `instances`
+        mapping or function. Events associated with unknown instances are
+        discarded.
+
+        If `pool` is provided, event payloads are copied to buffers acquired
+        from pool (runner should be configured with same pool).
+
+        Ring's tail counter is updated only once, after all available events
+        are registered. Number of registered events is returned.
+
+        """
+        head, tail = _counters.unpack_from(self._buf, 0)
+        if max_count is not None:
+            head = min(head, tail + max_count)
+
+        get_instance = (instances.get if isinstance(instances, Mapping)
+                        else instances)
+        register = runner.register
+        count = 0
+
+        for i in range(tail, head):
+            instance_id, event = self._read_slot(i % self._slot_count, pool)
+
+            stc = get_instance(instance_id)
+            if stc is None:
+                continue
+
+            register(stc, event)
+            count += 1
+
+        if head != tail:
+            _tail.pack_into(self._buf, _head.size, head)
+
+        return count
+
+    def _read_slot(self, index, pool):
+        slot_offset = self._slots_offset + index * _slot.size
+        instance_id, event_id, payload_offset, payload_length = \
+            _slot.unpack_from(self._buf, slot_offset)
+
+        event = self._events[event_id]
+        if payload_length != _no_payload:
+            payload = self._buf[payload_offset:payload_offset+payload_length]
+            payload = (pool.acquire(payload) if pool is not None
+                       else bytes(payload))
+            event = Event(event.name, payload)
+
+        return instance_id, event
+
+
+def _calculate_names_checksum(event_names):
+    return zlib.crc32('\n'.join(event_names).encode('utf-8'))
+
+
+_max_u32 = 0xFFFF_FFFF
+
+_no_payload = 0xFFFF_FFFF
+
+# head, tail, slot count, payload size, event names checksum
+_header = struct.Struct('<QQIII4x')
+
+# head, tail
+_counters = struct.Struct('<QQ')
+_head = struct.Struct('<Q')
+_tail = struct.Struct('<Q')
+
+# instance id, event id, payload offset, payload length
+_slot = struct.Struct('<IIII')
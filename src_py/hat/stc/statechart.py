@@ -1,32 +1,42 @@
 """Statechart module"""
 
 from collections.abc import Callable, Iterable
-import collections
 import typing
 
-from hat.stc.common import StateName, ActionName, ConditionName, Event, State
-
-
-Action: typing.TypeAlias = Callable[['Statechart',
-                                     Event | None],
-                                    None]
-"""Action function
-
-Action implementation which can be executed as part of entering/exiting
-state or transition execution. It is called with statechart instance and
-`Event` which triggered transition. In case of initial actions, run during
-transition to initial state, it is called with ``None``.
-
-"""
-
-Condition: typing.TypeAlias = Callable[['Statechart',
-                                        Event | None],
-                                       bool]
-"""Condition function
-
-Condition implementation used as transition guard. It is called with statechart
-instance and `Event` which triggered transition. Return value ``True`` is
-interpreted as satisfied condition.
+from hat.stc.common import (StateName,
+                            ActionName,
+                            ConditionName,
+                            Action,
+                            Condition,
+                            Event,
+                            HistoryType,
+                            State,
+                            RegisterCallbackHandle)
+from hat.stc.model import StateIndex, CompiledTransition, Model
+
+
+class StateChange(typing.NamedTuple):
+    """State change notification"""
+    statechart: 'Statechart'
+    """Statechart instance"""
+    source: StateIndex | None
+    """Active state index before transition"""
+    target: StateIndex | None
+    """Active state index after transition"""
+    event: Event
+    """Event which triggered transition"""
+
+
+StateChangeCb: typing.TypeAlias = Callable[[StateChange], None]
+"""State change callback"""
+
+MigrationCb: typing.TypeAlias = Callable[['Statechart', StateName],
+                                         StateName | None]
+"""Migration callback
+
+Migration callback is called with statechart instance and name of its active
+state which doesn't exist in new model. Result is name of new model's state
+which should become active (or ``None`` for default mapping).
 
 """
 
@@ -35,7 +45,9 @@ class Statechart:
     """Statechart engine
 
     Each instance is initialized with state definitions (first state is
-    considered initial) and action and condition definitions.
+    considered initial) and action and condition definitions. Instead of
+    state definitions, already compiled `Model` can be provided (in that case,
+    `actions` and `conditions` are ignored).
 
     During initialization, statechart will transition to initial state.
 
@@ -49,127 +61,419 @@ class Statechart:
     Condition is considered met only if result of calling condition function is
     ``True``.
 
+    Each instance can be associated with arbitrary context object (e.g.
+    instance's data model) available to actions and conditions as
+    `Statechart.context`. This enables sharing of same action and condition
+    implementations (and same compiled model) between all instances.
+
+    Statechart instances don't have instance dictionaries - each instance
+    stores only reference to compiled model, context, index of active state
+    and optional history and callback lists (on CPython 3.11, instance of
+    model without history states occupies about 88 bytes).
+
     Args:
-        states: all state definitions with (first state is initial)
+        states: all state definitions with (first state is initial) or
+            compiled model
         actions: mapping of action names to their implementation
         conditions: mapping of conditions names to their implementation
+        context: context object
 
     """
 
+    __slots__ = ('_model', '_context', '_state', '_history', '_change_cbs',
+                 '__weakref__')
+
     def __init__(self,
-                 states: Iterable[State],
-                 actions: dict[ActionName, Action],
-                 conditions: dict[ConditionName, Condition] = {}):
-        states = collections.deque(states)
-        initial = states[0].name if states else None
-
-        self._actions = actions
-        self._conditions = conditions
-        self._states = {}
-        self._parents = {}
-        self._stack = collections.deque()
-
-        while states:
-            state = states.pop()
-            states.extend(state.children)
-            self._states[state.name] = state
-            self._parents.update({i.name: state.name for i in state.children})
-
-        if initial:
-            self._walk_down(initial, None)
+                 states: Iterable[State] | Model,
+                 actions: dict[ActionName, Action] = {},
+                 conditions: dict[ConditionName, Condition] = {},
+                 context: typing.Any = None):
+        self._init((states if isinstance(states, Model)
+                    else Model(states, actions, conditions)),
+                   context)
+        self._enter_initial()
+
+    @property
+    def model(self) -> Model:
+        """Compiled model"""
+        return self._model
+
+    @property
+    def context(self) -> typing.Any:
+        """Context object"""
+        return self._context
+
+    @context.setter
+    def context(self, context: typing.Any):
+        self._context = context
 
     @property
     def state(self) -> StateName | None:
         """Current state"""
-        return self._stack[-1] if self._stack else None
+        state = self._state
+        return self._model.states[state].name if state is not None else None
+
+    @property
+    def state_index(self) -> StateIndex | None:
+        """Current state index"""
+        return self._state
 
     @property
     def finished(self) -> bool:
         """Is statechart in final state"""
-        state = self.state
-        return not state or self._states[state].final
-
-    def step(self, event: Event):
-        """Process single event"""
+        state = self._state
+        return state is None or self._model.states[state].final
+
+    def register_change_cb(self,
+                           cb: StateChangeCb
+                           ) -> RegisterCallbackHandle:
+        """Register state change callback
+
+        Callback is called after each triggered transition (including local
+        and internal transitions). While there are no registered callbacks,
+        events are processed without any notification overhead.
+
+        """
+        if self._change_cbs is None:
+            self._change_cbs = []
+
+        self._change_cbs.append(cb)
+        return RegisterCallbackHandle(
+            lambda: self._unregister_change_cb(cb))
+
+    def migrate(self,
+                model: Model,
+                migration_cb: MigrationCb | None = None):
+        """Replace model while preserving active configuration
+
+        Active state is mapped to state with same name in new `model`. If
+        active state doesn't exist in new model, `migration_cb` is called. If
+        migration callback is not provided or it returns ``None``, closest
+        ancestor of active state which exists in new model is used (or new
+        model's initial state if no such ancestor exists). If mapped state
+        has children, its initial descendants become active. Migration
+        callback should not return name of history pseudo-state
+        (`ValueError` is raised).
+
+        History of states which exist in both models is preserved. Entry
+        and exit actions are not executed during migration. Statechart
+        without active state (e.g. created by `create_statecharts` without
+        initialization) remains without active state.
+
+        """
+        self._migrate(model, _create_migration(self._model, model),
+                      migration_cb)
+
+    def step(self, event: Event) -> CompiledTransition | None:
+        """Process single event
+
+        Triggered transition is returned (``None`` if event didn't trigger
+        any transition).
+
+        """
+        if self._change_cbs is not None:
+            return self._observed_step(event)
+
+        return self._step(event)
+
+    def _init(self, model, context):
+        self._model = model
+        self._context = context
+        self._state = None
+        self._history = ([None] * model.history_count
+                         if model.history_count else None)
+        self._change_cbs = None
+
+    def _enter_initial(self):
+        self._walk_down(self._model.initial, None)
+
+        coverage = self._model._coverage
+        if coverage is not None:
+            coverage._on_initial()
+
+    def _step(self, event):
         if self.finished:
             return
 
-        state, transition = self._find_state_transition(self.state, event)
+        transition = self._find_transition(event)
         if not transition:
             return
 
-        if transition.target:
-            ancestor = self._find_ancestor(state, transition.target,
-                                           transition.internal)
-            self._walk_up(ancestor, event)
+        if transition.target is not None:
+            self._walk_up(transition.ancestor, event)
 
-        self._exec_actions(transition.actions, event)
+        self._exec_actions(transition.effects, event)
 
-        if transition.target:
-            self._walk_down(transition.target, event)
+        if transition.target is not None:
+            self._walk_down(transition.entries, event)
 
-    def _walk_up(self, target, event):
-        while self.state != target:
-            state = self._states[self.state]
-            self._exec_actions(state.exits, event)
-            self._stack.pop()
+            if transition.history is not None:
+                self._restore_history(transition.history, event)
 
-    def _walk_down(self, target, event):
-        states = collections.deque([self._states[target]])
+        coverage = self._model._coverage
+        if coverage is not None:
+            coverage._transition_counts[transition.index] += 1
 
-        while ((state := states[0]).name != self.state and
-                (parent := self._parents.get(state.name))):
-            states.appendleft(self._states[parent])
+        return transition
 
-        while (state := states[-1]).children:
-            states.append(state.children[0])
+    def _migrate(self, model, migration, migration_cb):
+        state = self._state
 
-        if states[0].name == self.state:
-            states.popleft()
+        next_state = None
 
-        for state in states:
-            self._stack.append(state.name)
-            self._exec_actions(state.entries, event)
+        if state is not None:
+            next_state = migration.states[state]
 
-    def _find_state_transition(self, state, event):
-        while state:
-            for transition in self._states[state].transitions:
-                if transition.event != event.name:
-                    continue
+            if next_state is None and migration_cb:
+                name = migration_cb(self, self._model.states[state].name)
+                if name is not None:
+                    next_state = model.states[model.get_state_index(name)]
+                    if next_state.history is not None:
+                        raise ValueError(f'invalid migration state {name}')
+
+                    next_state = next_state.descent[-1]
 
-                if not all(self._conditions[condition](self, event)
-                           for condition in transition.conditions):
+            if next_state is None:
+                next_state = migration.fallbacks[state]
+
+        next_history = None
+        if model.history_count:
+            next_history = [None] * model.history_count
+            for slot, next_slot, parent in migration.history:
+                leaf = self._history[slot]
+                if leaf is None:
                     continue
 
-                return state, transition
+                leaf = migration.states[leaf]
+                if leaf is not None and parent in model.states[leaf].path:
+                    next_history[next_slot] = leaf
+
+        self._model = model
+        self._state = next_state
+        self._history = next_history
+
+    def _observed_step(self, event):
+        state = self._state
+        transition = self._step(event)
+        if transition is None:
+            return
+
+        change = StateChange(statechart=self,
+                             source=state,
+                             target=self._state,
+                             event=event)
+        for cb in list(self._change_cbs):
+            cb(change)
+
+        return transition
+
+    def _unregister_change_cb(self, cb):
+        if not self._change_cbs or cb not in self._change_cbs:
+            return
+
+        self._change_cbs.remove(cb)
+        if self._change_cbs:
+            return
+
+        self._change_cbs = None
+
+    def _walk_up(self, ancestor, event):
+        states = self._model.states
+        history = self._history
+        leaf = self._state
+
+        while self._state != ancestor:
+            state = states[self._state]
+            self._exec_actions(state.exit_actions, event)
+
+            if history is not None and state.history_slot is not None:
+                history[state.history_slot] = leaf
+
+            self._state = state.parent
+
+    def _walk_down(self, entries, event):
+        states = self._model.states
+        for i in entries:
+            self._state = i
+            self._exec_actions(states[i].entry_actions, event)
+
+    def _restore_history(self, history, event):
+        states = self._model.states
+        history_state = states[history]
+        parent = states[history_state.parent]
+        leaf = self._history[parent.history_slot]
+
+        if leaf is None:
+            entries = parent.descent[1:]
+
+        elif history_state.history == HistoryType.DEEP:
+            entries = states[leaf].path[len(parent.path):]
 
-            state = self._parents.get(state)
+        else:
+            entries = states[states[leaf].path[len(parent.path)]].descent
 
-        return None, None
+        self._walk_down(entries, event)
 
-    def _find_ancestor(self, state, sibling, internal):
-        if not sibling or not state:
+    def _find_transition(self, event):
+        candidates = self._model.states[self._state].dispatch.get(event.name)
+        if candidates is None:
+            candidates = self._model.get_candidates(self._state, event.name)
+
+        if not candidates:
             return
 
-        path = collections.deque([sibling])
-        while (parent := self._parents.get(path[0])):
-            path.appendleft(parent)
+        pure_guards = self._model.pure_guards
+        if not pure_guards:
+            for transition in candidates:
+                for guard in transition.guards:
+                    if not guard(self, event):
+                        break
+
+                else:
+                    return transition
 
-        ancestor = None
-        for i, j in zip(self._stack, path):
-            if i != j:
-                break
+            return
 
-            if i in [sibling, state]:
-                if internal and i == state:
-                    ancestor = i
-                break
+        results = {}
+        for transition in candidates:
+            for guard in transition.guards:
+                if guard in pure_guards:
+                    result = results.get(guard)
+                    if result is None:
+                        result = results[guard] = bool(guard(self, event))
 
-            ancestor = i
+                else:
+                    result = guard(self, event)
 
-        return ancestor
+                if not result:
+                    break
 
-    def _exec_actions(self, names, event):
-        for name in names:
-            action = self._actions[name]
+            else:
+                return transition
+
+    def _exec_actions(self, actions, event):
+        for action in actions:
             action(self, event)
+
+
+def create_statecharts(model: Model,
+                       contexts: Iterable[typing.Any],
+                       cls: type[Statechart] = Statechart,
+                       initialize: bool = True
+                       ) -> list[Statechart]:
+    """Create multiple statecharts sharing same model
+
+    Single instance of `cls` (`Statechart` or its subclass, e.g. generated
+    statechart) is created for each context. Instances are created without
+    calling `cls` initializer - if `initialize` is set, initial state of each
+    instance is entered same as during `Statechart` initialization.
+
+    If `initialize` is not set, instances don't have active state until
+    `initialize_statecharts` is called for them. This enables separation of
+    instance allocation from execution of initial entry actions (e.g. with
+    `hat.stc.AsyncRunner.initialize`).
+
+    """
+    statecharts = []
+    for context in contexts:
+        stc = cls.__new__(cls)
+        stc._init(model, context)
+        statecharts.append(stc)
+
+    if initialize:
+        initialize_statecharts(statecharts)
+
+    return statecharts
+
+
+def initialize_statecharts(statecharts: Iterable[Statechart]):
+    """Enter initial state of statecharts created without initialization
+
+    Initial state of each statechart is entered (and initial entry actions
+    are executed) same as during `Statechart` initialization. This function
+    should be called only once for each statechart created by
+    `create_statecharts` without initialization.
+
+    """
+    initial_states = {}
+    for stc in statecharts:
+        model = stc._model
+        if model not in initial_states:
+            initial_states[model] = _get_initial_state(model)
+
+        state = initial_states[model]
+        if state is None:
+            stc._enter_initial()
+
+        else:
+            stc._state = state
+
+
+def migrate_statecharts(statecharts: Iterable[Statechart],
+                        model: Model,
+                        migration_cb: MigrationCb | None = None):
+    """Replace model of multiple statecharts
+
+    See `Statechart.migrate`. Mapping between models is calculated only once
+    for each distinct model used by `statecharts`.
+
+    """
+    migrations = {}
+    for stc in statecharts:
+        migration = migrations.get(stc.model)
+        if migration is None:
+            migration = migrations[stc.model] = _create_migration(stc.model,
+                                                                  model)
+
+        stc._migrate(model, migration, migration_cb)
+
+
+def _get_initial_state(model):
+    if not model.initial or model._coverage is not None:
+        return
+
+    if any(model.states[i].entry_actions for i in model.initial):
+        return
+
+    return model.initial[-1]
+
+
+class _Migration(typing.NamedTuple):
+    states: list[StateIndex | None]
+    fallbacks: list[StateIndex | None]
+    history: list[tuple[int, int, StateIndex]]
+
+
+def _create_migration(model, next_model):
+    initial = next_model.initial[-1] if next_model.initial else None
+    states = []
+    fallbacks = []
+    history = []
+
+    for state in model.states:
+        try:
+            index = next_model.get_state_index(state.name)
+
+        except KeyError:
+            index = None
+
+        next_state = (next_model.states[index]
+                      if index is not None else None)
+        if next_state is not None and next_state.history is None:
+            states.append(next_state.descent[-1])
+            fallbacks.append(next_state.descent[-1])
+
+        else:
+            states.append(None)
+            fallbacks.append(fallbacks[state.parent]
+                             if state.parent is not None else initial)
+
+        if (state.history_slot is not None and
+                next_state is not None and
+                next_state.history_slot is not None):
+            history.append((state.history_slot, next_state.history_slot,
+                            index))
+
+    return _Migration(states=states,
+                      fallbacks=fallbacks,
+                      history=history)
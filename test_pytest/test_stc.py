@@ -1,11 +1,17 @@
+import asyncio
 import collections
 import io
+import json
+import os
+import sys
+import time
 
 import pytest
 
 from hat import aio
 
 from hat import stc
+import hat.stc.analysis
 
 
 @pytest.mark.parametrize("scxml, states", [
@@ -81,6 +87,19 @@ from hat import stc
                              stc.Transition('e2', None,
                                             conditions=['c2', 'c3'])])]),
 
+    (r"""<?xml version="1.0" encoding="UTF-8"?>
+        <scxml xmlns="http://www.w3.org/2005/07/scxml" initial="s1" version="1.0">
+        <state id="s1" initial="s2">
+            <history id="h1"/>
+            <history id="h2" type="deep"/>
+            <state id="s2"/>
+        </state>
+        </scxml>""",  # NOQA
+     [stc.State('s1',
+                children=[stc.State('s2'),
+                          stc.State('h1', history=stc.HistoryType.SHALLOW),
+                          stc.State('h2', history=stc.HistoryType.DEEP)])]),
+
 ])
 def test_parse_scxml(scxml, states):
     result = stc.parse_scxml(io.StringIO(scxml))
@@ -344,3 +363,1268 @@ async def test_async_timer():
             assert event == i
 
     await runner.async_close()
+
+
+def test_event_ring():
+    queue = collections.deque()
+    states = [stc.State('s1',
+                        transitions=[stc.Transition('e1', None, ['a']),
+                                     stc.Transition('e2', None, ['a'])])]
+    actions = {'a': lambda _, e: queue.append(e)}
+    instances = {1: stc.Statechart(states, actions),
+                 2: stc.Statechart(states, actions)}
+    runner = stc.SyncRunner()
+
+    producer = stc.create_event_ring(['e1', 'e2'],
+                                     slot_count=2,
+                                     payload_size=4)
+    consumer = stc.connect_event_ring(producer.name, ['e1', 'e2'])
+
+    with pytest.raises(ValueError):
+        stc.connect_event_ring(producer.name, ['e2', 'e1'])
+
+    assert producer.put(1, stc.Event('e1'))
+    assert producer.put(2, stc.Event('e2', b'abc'))
+    assert not producer.put(1, stc.Event('e1'))
+    assert len(consumer) == 2
+
+    with pytest.raises(ValueError):
+        producer.put(1, stc.Event('e3'))
+
+    assert consumer.drain(runner, instances) == 2
+    assert len(producer) == 0
+
+    while not runner.empty:
+        runner.step()
+
+    assert list(queue) == [stc.Event('e1'), stc.Event('e2', b'abc')]
+    queue.clear()
+
+    with pytest.raises(ValueError):
+        producer.put(1, stc.Event('e1', b'abcde'))
+
+    with pytest.raises(ValueError):
+        producer.put(2**32, stc.Event('e1'))
+
+    with pytest.raises(ValueError):
+        producer.put(-1, stc.Event('e1'))
+
+    assert producer.put(3, stc.Event('e1', b''))
+    assert consumer.get() == (3, stc.Event('e1', b''))
+    assert consumer.get() is None
+
+    consumer.close()
+    producer.close()
+    producer.unlink()
+
+    with pytest.raises(ValueError):
+        stc.create_event_ring(['e1'], slot_count=2**16, payload_size=2**16)
+
+    with pytest.raises(ValueError):
+        stc.create_event_ring(['e1'], slot_count=2**32)
+
+
+def test_model():
+    queue = collections.deque()
+    states = [stc.State('s1',
+                        children=[stc.State('s2',
+                                            transitions=[
+                                                stc.Transition('e', 's3')])],
+                        transitions=[stc.Transition('e', 's1'),
+                                     stc.Transition('f', 's3')],
+                        entries=['enter']),
+              stc.State('s3', entries=['enter'])]
+    actions = {'enter': lambda s, _: queue.append(s.state)}
+    model = stc.Model(states, actions)
+
+    assert [state.name for state in model.states] == ['s1', 's2', 's3']
+    assert model.initial == (0, 1)
+    assert model.event_names == ['e', 'f']
+    assert model.get_event('e') is model.get_event('e')
+    assert model.get_event('x') == stc.Event('x')
+
+    s2 = model.states[model.get_state_index('s2')]
+    assert [t.target for t in s2.dispatch['e']] == [2, 0]
+    assert [t.target for t in s2.dispatch['f']] == [2]
+
+    machine1 = stc.Statechart(model)
+    machine2 = stc.Statechart(model)
+    assert list(queue) == ['s1', 's1']
+    queue.clear()
+
+    machine1.step(model.get_event('e'))
+    assert machine1.state == 's3'
+    assert machine2.state == 's2'
+    assert list(queue) == ['s3']
+
+    with pytest.raises(ValueError):
+        stc.Model([stc.State('s1', transitions=[stc.Transition('e', 's2')])],
+                  {})
+
+
+def test_conditions_pure_and_ranks():
+    calls = collections.deque()
+
+    def create_condition(name, result):
+
+        def condition(_, __):
+            calls.append(name)
+            return result
+
+        return condition
+
+    states = [stc.State(
+        's1',
+        transitions=[stc.Transition('e', None, conditions=['c1', 'c2']),
+                     stc.Transition('e', None, conditions=['c1', 'c3']),
+                     stc.Transition('e', None, conditions=['c3', 'c1'])])]
+    conditions = {'c1': create_condition('c1', True),
+                  'c2': create_condition('c2', False),
+                  'c3': create_condition('c3', False)}
+
+    machine = stc.Statechart(states, {}, conditions)
+    machine.step(stc.Event('e'))
+    assert list(calls) == ['c1', 'c2', 'c1', 'c3', 'c3']
+    calls.clear()
+
+    model = stc.Model(states, {}, conditions,
+                      pure_conditions=['c1', 'c3'])
+    machine = stc.Statechart(model)
+    machine.step(stc.Event('e'))
+    assert list(calls) == ['c1', 'c2', 'c3']
+    calls.clear()
+
+    profiler = stc.ConditionProfiler(conditions)
+    machine = stc.Statechart(states, {}, profiler.conditions)
+    machine.step(stc.Event('e'))
+    calls.clear()
+
+    ranks = profiler.get_ranks()
+    assert ranks['c1'] == float('inf')
+    assert ranks['c2'] < ranks['c1']
+    assert ranks['c3'] < ranks['c1']
+
+    model = stc.Model(states, {}, conditions, condition_ranks=ranks)
+    machine = stc.Statechart(model)
+    machine.step(stc.Event('e'))
+    assert calls[0] in ('c2', 'c3')
+    assert 'c1' not in calls
+
+    with pytest.raises(ValueError):
+        stc.Statechart(states, {}, {'c1': conditions['c1']})
+
+
+def test_undefined_actions():
+    queue = collections.deque()
+    states = [stc.State('s1',
+                        entries=['a1'],
+                        exits=['a2'],
+                        transitions=[stc.Transition('e', 's1', ['a3'],
+                                                    ['c1'])])]
+    actions = {'a1': lambda _, __: queue.append('a1')}
+
+    with pytest.raises(ValueError) as e:
+        stc.Statechart(states, actions)
+
+    assert str(e.value) == ('undefined action a2, action a3, '
+                            'condition c1')
+    assert not queue
+
+
+def test_analyze():
+    t1 = stc.Transition('e1', 's3')
+    t2 = stc.Transition('e1', 's4')
+    t3 = stc.Transition('e2', 's5')
+    t4 = stc.Transition('e2', 's1', conditions=['c'])
+    t5 = stc.Transition('e2', 's1')
+    states = [stc.State('s1',
+                        children=[stc.State('s2', transitions=[t5]),
+                                  stc.State('s3', transitions=[t4, t5])],
+                        transitions=[t1, t2]),
+              stc.State('s4', transitions=[t3]),
+              stc.State('s1'),
+              stc.State('s6')]
+
+    Issue = hat.stc.analysis.Issue
+    IssueType = hat.stc.analysis.IssueType
+    Statistics = hat.stc.analysis.Statistics
+
+    result = hat.stc.analysis.analyze(states)
+    assert result.issues == [
+        Issue(IssueType.DUPLICATE_STATE, 's1'),
+        Issue(IssueType.INVALID_TARGET, 's4', t3),
+        Issue(IssueType.SHADOWED_TRANSITION, 's1', t2),
+        Issue(IssueType.UNREACHABLE_STATE, 's6')]
+    assert result.statistics == Statistics(state_count=6,
+                                           transition_count=6,
+                                           event_count=2,
+                                           depth=2,
+                                           fan_out=2,
+                                           transitions_per_state=2,
+                                           events_per_state=2)
+
+    with pytest.raises(ValueError):
+        stc.Model(states, {})
+
+    t6 = stc.Transition('e1', 's1')
+    t7 = stc.Transition('e2', 'h')
+    states = [stc.State('s1',
+                        children=[stc.State('s2', transitions=[t6, t7]),
+                                  stc.State('h',
+                                            history=stc.HistoryType.DEEP)],
+                        transitions=[t6])]
+    result = hat.stc.analysis.analyze(states)
+    assert result.issues == [
+        Issue(IssueType.SHADOWED_TRANSITION, 's1', t6)]
+
+    t8 = stc.Transition('error', 's2')
+    t9 = stc.Transition('error.io timeout', 's2')
+    t10 = stc.Transition('error.io', 's2')
+    t11 = stc.Transition('timeout.*', 's2')
+    t12 = stc.Transition('*', 's2')
+    t13 = stc.Transition('error.io.read', 's2')
+    states = [stc.State('s1',
+                        children=[stc.State('s2', transitions=[t8]),
+                                  stc.State('s3', transitions=[t12])],
+                        transitions=[t13, t9]),
+              stc.State('s4', transitions=[t10, t11, t9])]
+    result = hat.stc.analysis.analyze(states)
+    assert result.issues == [
+        Issue(IssueType.SHADOWED_TRANSITION, 's4', t9),
+        Issue(IssueType.SHADOWED_TRANSITION, 's1', t13),
+        Issue(IssueType.UNREACHABLE_STATE, 's3'),
+        Issue(IssueType.UNREACHABLE_STATE, 's4')]
+    assert result.statistics.event_count == 5
+    assert result.statistics.events_per_state == 4
+
+
+@pytest.mark.parametrize('cache', [False, True])
+def test_compile_statechart(tmp_path, cache):
+    states = [
+        stc.State('s1',
+                  children=[
+                      stc.State('s2',
+                                transitions=[
+                                    stc.Transition('e1', 's3', ['t1'],
+                                                   ['c1']),
+                                    stc.Transition('e1', 's2', ['t2'])],
+                                entries=['enter'],
+                                exits=['exit']),
+                      stc.State('s3',
+                                transitions=[
+                                    stc.Transition('e2', 's1', ['t3'],
+                                                   internal=True)],
+                                entries=['enter'],
+                                exits=['exit'])],
+                  transitions=[stc.Transition('e3', 's4', ['t4']),
+                               stc.Transition('e4', None, ['t5'])],
+                  entries=['enter'],
+                  exits=['exit']),
+        stc.State('s4', entries=['enter'], final=True)]
+
+    def create_statechart(cls):
+        queue = collections.deque()
+        actions = {
+            'enter': lambda s, e: queue.append(('enter', s.state, e)),
+            'exit': lambda s, e: queue.append(('exit', s.state, e)),
+            **{f't{i}': (lambda i: lambda s, e: queue.append((i, s.state, e))
+                         )(i)
+               for i in range(1, 6)}}
+        conditions = {'c1': lambda _, e: e.payload}
+        return cls(states, actions, conditions), queue
+
+    cache_dir = tmp_path if cache else None
+    cls = stc.compile_statechart(states, cache_dir)
+    assert issubclass(cls, stc.GeneratedStatechart)
+    assert stc.compile_statechart(states, cache_dir) is cls
+
+    if cache:
+        assert list(tmp_path.glob('*.py'))
+        assert not list(tmp_path.glob('*.tmp'))
+
+    machine1, queue1 = create_statechart(stc.Statechart)
+    machine2, queue2 = create_statechart(cls)
+
+    events = [stc.Event('e1', False),
+              stc.Event('e4'),
+              stc.Event('e1', True),
+              stc.Event('e2'),
+              stc.Event('e5'),
+              stc.Event('e1', True),
+              stc.Event('e3'),
+              stc.Event('e4')]
+    for event in events:
+        machine1.step(event)
+        machine2.step(event)
+
+        assert machine1.state == machine2.state
+        assert machine1.finished == machine2.finished
+        assert list(queue1) == list(queue2)
+
+    assert machine2.finished
+
+    with pytest.raises(ValueError):
+        cls(states[:1], {'enter': lambda _, __: None,
+                         'exit': lambda _, __: None,
+                         **{f't{i}': lambda _, __: None
+                            for i in range(1, 6)}},
+            {'c1': lambda _, __: True})
+
+
+def test_compile_statechart_hash_mismatch(tmp_path):
+    states = [stc.State('s1', transitions=[stc.Transition('e1', 's2')]),
+              stc.State('s2')]
+    model = stc.Model(states, {}, {})
+    path = tmp_path / f'stc_{stc.get_model_hash(model)}.py'
+    path.write_text(stc.generate_source(stc.Model([stc.State('s1')], {}, {})),
+                    encoding='utf-8')
+
+    with pytest.raises(ValueError):
+        stc.compile_statechart(states, tmp_path)
+
+
+@pytest.mark.parametrize('generated', [False, True])
+def test_history(generated):
+    queue = collections.deque()
+    states = [
+        stc.State('s1',
+                  children=[
+                      stc.State('h1', history=stc.HistoryType.SHALLOW),
+                      stc.State('h2', history=stc.HistoryType.DEEP),
+                      stc.State('s2'),
+                      stc.State('s3',
+                                children=[stc.State('s4',
+                                                    transitions=[
+                                                        stc.Transition('e2',
+                                                                       's5')]),
+                                          stc.State('s5')],
+                                entries=['enter'])],
+                  transitions=[stc.Transition('e1', 's3'),
+                               stc.Transition('out', 's6')]),
+        stc.State('s6',
+                  transitions=[stc.Transition('shallow', 'h1'),
+                               stc.Transition('deep', 'h2')])]
+    actions = {'enter': lambda s, _: queue.append(s.state)}
+
+    cls = stc.compile_statechart(states) if generated else stc.Statechart
+    machine = cls(states, actions)
+    assert machine.state == 's2'
+
+    machine.step(stc.Event('out'))
+    machine.step(stc.Event('deep'))
+    assert machine.state == 's2'
+
+    machine.step(stc.Event('e1'))
+    machine.step(stc.Event('e2'))
+    assert machine.state == 's5'
+    assert list(queue) == ['s3']
+    queue.clear()
+
+    machine.step(stc.Event('out'))
+    assert machine.state == 's6'
+
+    machine.step(stc.Event('deep'))
+    assert machine.state == 's5'
+    assert list(queue) == ['s3']
+    queue.clear()
+
+    machine.step(stc.Event('out'))
+    machine.step(stc.Event('shallow'))
+    assert machine.state == 's4'
+    assert list(queue) == ['s3']
+
+    with pytest.raises(ValueError):
+        stc.Model([stc.State('h', history=stc.HistoryType.SHALLOW)], {})
+
+
+@pytest.mark.parametrize('generated', [False, True])
+def test_event_descriptors(generated):
+    queue = collections.deque()
+    states = [
+        stc.State('s1',
+                  children=[
+                      stc.State('s2',
+                                transitions=[
+                                    stc.Transition('error.io.*', None, ['a1']),
+                                    stc.Transition('x y.z', None, ['a2'])])],
+                  transitions=[stc.Transition('error', None, ['a3']),
+                               stc.Transition('*', None, ['a4'])])]
+    actions = {f'a{i}': (lambda i: lambda _, e: queue.append((f'a{i}',
+                                                              e.name)))(i)
+               for i in range(1, 5)}
+
+    cls = stc.compile_statechart(states) if generated else stc.Statechart
+    machine = cls(states, actions)
+
+    for name in ['error.io.read', 'error.io', 'error.iox', 'error', 'errors',
+                 'x', 'x.a', 'y', 'y.z.w', 'error.io.read']:
+        machine.step(stc.Event(name))
+
+    assert list(queue) == [('a1', 'error.io.read'),
+                           ('a1', 'error.io'),
+                           ('a3', 'error.iox'),
+                           ('a3', 'error'),
+                           ('a4', 'errors'),
+                           ('a2', 'x'),
+                           ('a2', 'x.a'),
+                           ('a4', 'y'),
+                           ('a2', 'y.z.w'),
+                           ('a1', 'error.io.read')]
+
+    model = machine.model
+    assert set(model.event_names) == {'error', 'x', 'y.z'}
+    assert len(model.get_candidates(1, 'error.io.a')) == 3
+
+
+def test_dot_graph():
+    states = [stc.State('s1',
+                        children=[
+                            stc.State('s2',
+                                      children=[stc.State('s3')],
+                                      transitions=[
+                                          stc.Transition('e1', 's4')]),
+                            stc.State('s4',
+                                      transitions=[
+                                          stc.Transition('e2', 's3')])],
+                        entries=['a1'],
+                        exits=['a2']),
+              stc.State('s5',
+                        transitions=[stc.Transition('e3', 's3')])]
+
+    cache = stc.DotCache()
+    dot = stc.create_dot_graph(states, cache=cache)
+    assert 'entry/ a1' in dot
+    assert 'exit/ a2' in dot
+    assert dot.count(' -> ') == 6
+
+    f = io.StringIO()
+    stc.write_dot_graph(f, states, cache=cache)
+    assert f.getvalue() == dot
+
+    dot = stc.create_dot_graph(states, root='s2')
+    assert 's5' not in dot
+    assert 's3' in dot
+    assert dot.count(' -> ') == 2
+
+    dot = stc.create_dot_graph(states, max_depth=1)
+    assert 's2' not in dot
+    assert 's3' not in dot
+    assert 'state_1 -> state_0 [' in dot
+    assert dot.count(' -> ') == 2
+
+    with pytest.raises(ValueError):
+        stc.create_dot_graph(states, root='s6')
+
+
+def test_monitor():
+    states = [stc.State('s1',
+                        children=[
+                            stc.State('s2',
+                                      transitions=[
+                                          stc.Transition('e1', 's3')]),
+                            stc.State('s3')],
+                        transitions=[stc.Transition('e2', 's4')]),
+              stc.State('s4')]
+    model = stc.Model(states, {})
+    monitor = stc.Monitor(model)
+    runner = stc.SyncRunner(monitor=monitor)
+
+    instances = [stc.Statechart(model) for _ in range(3)]
+    for instance in instances:
+        monitor.register(instance)
+
+    runner.register(instances[0], stc.Event('e1'))
+    runner.register(instances[1], stc.Event('e2'))
+    runner.register(instances[2], stc.Event('e3'))
+    while not runner.empty:
+        runner.step()
+
+    overlay = monitor.get_overlay()
+    assert overlay.instances == 3
+    assert {state.name: state.active for state in overlay.states} == {
+        's1': 2, 's2': 1, 's3': 1, 's4': 1}
+    assert [transition.count for transition in overlay.transitions] == [
+        1, 1]
+
+    json_data = stc.overlay_to_json(overlay)
+    assert json_data['states'][0] == {'name': 's1', 'active': 2}
+
+    highlight = stc.overlay_to_dot_highlight(overlay)
+    assert highlight.states['s2'] == '1 active'
+    assert set(highlight.transitions.keys()) == {('s1', 0), ('s2', 0)}
+
+    dot = stc.create_dot_graph(states, highlight=highlight)
+    assert dot.count(' color = "red"') == 6
+
+    monitor.unregister(instances[0])
+    overlay = monitor.get_overlay()
+    assert overlay.instances == 2
+    assert all(transition.rate == 0 for transition in overlay.transitions)
+
+    unregistered = stc.Statechart(model)
+    runner.register(unregistered, stc.Event('e2'))
+    runner.register(instances[0], stc.Event('e2'))
+    runner.drain()
+    overlay = monitor.get_overlay()
+    assert overlay.instances == 2
+    assert {state.name: state.active for state in overlay.states} == {
+        's1': 1, 's2': 1, 's3': 0, 's4': 1}
+
+    instances[2].migrate(stc.Model(states, {}))
+    runner.register(instances[2], stc.Event('e2'))
+    runner.drain()
+    overlay = monitor.get_overlay()
+    assert overlay.instances == 1
+    assert {state.name: state.active for state in overlay.states} == {
+        's1': 0, 's2': 0, 's3': 0, 's4': 1}
+
+    del instances[1]
+    overlay = monitor.get_overlay()
+    assert overlay.instances == 0
+    assert all(state.active == 0 for state in overlay.states)
+
+
+@pytest.mark.parametrize('generated', [False, True])
+def test_state_changes(generated):
+    states = [stc.State('s1',
+                        transitions=[stc.Transition('e1', 's2'),
+                                     stc.Transition('e2', None)]),
+              stc.State('s2')]
+    cls = stc.compile_statechart(states) if generated else stc.Statechart
+    instance = cls(states, {})
+    runner = stc.SyncRunner()
+
+    changes = []
+    handle = instance.register_change_cb(changes.append)
+    batches = []
+    runner.register_changes_cb(batches.append)
+
+    runner.register(instance, stc.Event('e2'))
+    runner.register(instance, stc.Event('e3'))
+    runner.register(instance, stc.Event('e1'))
+    runner.drain()
+
+    assert [(i.source, i.target, i.event.name) for i in changes] == [
+        (0, 0, 'e2'), (0, 1, 'e1')]
+    assert len(batches) == 1
+    assert [(i.statechart, i.source, i.target) for i in batches[0]] == [
+        (instance, 0, 0), (instance, 0, 1)]
+
+    handle.cancel()
+    instance.step(stc.Event('e1'))
+    assert len(changes) == 2
+
+
+@pytest.mark.parametrize('generated', [False, True])
+def test_migrate(generated):
+    states = [stc.State('s1',
+                        children=[stc.State('s2'),
+                                  stc.State('s3'),
+                                  stc.State('s4'),
+                                  stc.State('h',
+                                            history=stc.HistoryType.DEEP)],
+                        transitions=[stc.Transition('e2', 's3'),
+                                     stc.Transition('e3', 's4'),
+                                     stc.Transition('e4', 's5')]),
+              stc.State('s5',
+                        transitions=[stc.Transition('e5', 'h')])]
+    cls = stc.compile_statechart(states) if generated else stc.Statechart
+    model = stc.Model(states, {})
+
+    instances = [cls(model) for _ in range(4)]
+    instances[1].step(stc.Event('e2'))
+    instances[2].step(stc.Event('e3'))
+    instances[3].step(stc.Event('e2'))
+    instances[3].step(stc.Event('e4'))
+
+    deep = stc.HistoryType.DEEP
+    next_states = [stc.State('s1',
+                             children=[stc.State('s2'),
+                                       stc.State('s3'),
+                                       stc.State('h', history=deep)],
+                             transitions=[stc.Transition('e2', 's3'),
+                                          stc.Transition('e4', 's5')]),
+                   stc.State('s5',
+                             transitions=[stc.Transition('e5', 'h')])]
+    next_model = stc.Model(next_states, {})
+
+    removed = []
+
+    def on_migrate(instance, name):
+        removed.append(name)
+        return 's5'
+
+    stc.migrate_statecharts(instances, next_model, on_migrate)
+    assert removed == ['s4']
+    assert [i.state for i in instances] == ['s2', 's3', 's5', 's5']
+    assert all(i.model is next_model for i in instances)
+
+    instances[3].step(stc.Event('e5'))
+    assert instances[3].state == 's3'
+
+    instances[0].migrate(model)
+    assert instances[0].state == 's2'
+
+    instances[0].step(stc.Event('e3'))
+    assert instances[0].state == 's4'
+
+    instance = cls(model)
+    instance.step(stc.Event('e3'))
+    with pytest.raises(ValueError):
+        instance.migrate(next_model, lambda _, __: 'h')
+    assert instance.state == 's4'
+    assert instance.model is model
+
+    instance = stc.create_statecharts(model, [None], cls,
+                                      initialize=False)[0]
+    instance.migrate(next_model)
+    assert instance.state is None
+    stc.initialize_statecharts([instance])
+    assert instance.state == 's2'
+
+
+async def test_async_runner_priorities():
+    events = []
+    states = [stc.State('s1',
+                        transitions=[stc.Transition('*', None,
+                                                    actions=['append'])])]
+    actions = {'append': lambda _, e: events.append(e.name)}
+    instance = stc.Statechart(states, actions)
+
+    runner = stc.AsyncRunner(priority_count=3,
+                             priorities={'e1': 0})
+
+    runner.register(instance, stc.Event('e2'))
+    runner.register(instance, stc.Event('e3'), priority=1)
+    runner.register(instance, stc.Event('e4'), priority=1, deadline=10)
+    runner.register(instance, stc.Event('e5'), priority=1, deadline=1)
+    runner.register(instance, stc.Event('e1'))
+
+    with pytest.raises(ValueError):
+        runner.register(instance, stc.Event('e1'), priority=3)
+
+    await asyncio.sleep(0.01)
+    assert events == ['e1', 'e5', 'e4', 'e3', 'e2']
+
+    metrics = runner.get_metrics()
+    assert [i.processed for i in metrics] == [1, 3, 1]
+    assert all(i.queued == 0 for i in metrics)
+    assert all(i.missed_deadlines == 0 for i in metrics)
+
+    await runner.async_close()
+
+
+@pytest.mark.parametrize('generated', [False, True])
+def test_instance_size(generated):
+    states = [stc.State('s1', transitions=[stc.Transition('e1', 's2')]),
+              stc.State('s2')]
+    cls = stc.compile_statechart(states) if generated else stc.Statechart
+    model = stc.Model(states, {})
+    instances = [cls(model) for _ in range(2)]
+
+    assert not hasattr(instances[0], '__dict__')
+    assert sys.getsizeof(instances[0]) <= 88
+
+    instances[0].step(stc.Event('e1'))
+    assert [i.state for i in instances] == ['s2', 's1']
+
+
+def test_context():
+    states = [stc.State('s1',
+                        transitions=[stc.Transition('e1', 's2',
+                                                    conditions=['c1'])]),
+              stc.State('s2',
+                        entries=['a1'])]
+    actions = {'a1': lambda i, _: i.context.append('a1')}
+    conditions = {'c1': lambda i, _: i.context is not None}
+    model = stc.Model(states, actions, conditions)
+
+    instance = stc.Statechart(model)
+    assert instance.context is None
+    instance.step(stc.Event('e1'))
+    assert instance.state == 's1'
+
+    instance.context = []
+    instance.step(stc.Event('e1'))
+    assert instance.state == 's2'
+    assert instance.context == ['a1']
+
+    context = []
+    instance = stc.Statechart(model, context=context)
+    assert instance.context is context
+
+
+def test_sync_runner_run():
+    events = []
+    states = [stc.State('s1',
+                        transitions=[stc.Transition('*', None,
+                                                    actions=['append'])])]
+    actions = {'append': lambda i, e: events.append((i.context, e.name))}
+    model = stc.Model(states, actions)
+    instance1 = stc.Statechart(model, context=1)
+    instance2 = stc.Statechart(model, context=2)
+    runner = stc.SyncRunner()
+
+    for i in range(3):
+        runner.register(instance1, stc.Event(f'e{i}'))
+    runner.register(instance2, stc.Event('e0'))
+
+    result = runner.run(max_count=3, max_instance_count=1)
+    assert result == stc.RunResult(processed=3, remaining=1)
+    assert events == [(1, 'e0'), (2, 'e0'), (1, 'e1')]
+
+    runner.register(instance2, stc.Event('e1'))
+    result = runner.run(max_instance_count=1)
+    assert result == stc.RunResult(processed=2, remaining=0)
+    assert events[-2:] == [(1, 'e2'), (2, 'e1')]
+
+    for i in range(3):
+        runner.register(instance1, stc.Event(f'e{i}'))
+
+    result = runner.run(max_count=1)
+    assert result == stc.RunResult(processed=1, remaining=2)
+    assert events[-1] == (1, 'e0')
+
+    result = runner.run(max_duration=0, check_interval=1)
+    assert result == stc.RunResult(processed=1, remaining=1)
+    assert events[-1] == (1, 'e1')
+
+    runner.drain()
+    assert runner.empty
+
+    events.clear()
+    for i in range(100000):
+        runner.register(instance1, stc.Event('e'))
+    runner.register(instance2, stc.Event('e'))
+
+    start = time.monotonic()
+    result = runner.run(max_duration=0.002, max_instance_count=10,
+                        check_interval=16)
+    assert time.monotonic() - start < 0.05
+    assert result.remaining == 100001 - result.processed
+    assert events[:11] == [(1, 'e')] * 10 + [(2, 'e')]
+
+
+def test_mailbox_runner():
+    events = []
+    states = [stc.State('s1',
+                        transitions=[stc.Transition('*', None,
+                                                    actions=['append'])])]
+    actions = {'append': lambda i, e: events.append((i.context, e.name))}
+    model = stc.Model(states, actions)
+    instance1 = stc.Statechart(model, context=1)
+    instance2 = stc.Statechart(model, context=2)
+    runner = stc.MailboxRunner(mailbox_size=2)
+    runner.set_mailbox_size(instance2, 1)
+
+    assert runner.register(instance1, stc.Event('e1'))
+    assert runner.register(instance2, stc.Event('e2'))
+    assert runner.register(instance1, stc.Event('e3'))
+    assert not runner.register(instance1, stc.Event('e4'))
+    assert not runner.register(instance2, stc.Event('e5'))
+
+    runner.step()
+    assert events == [(1, 'e1'), (1, 'e3')]
+
+    assert runner.register(instance1, stc.Event('e6'))
+    runner.drain()
+    assert events[2:] == [(2, 'e2'), (1, 'e6')]
+    assert runner.empty
+
+
+def test_buffer_pool():
+    payloads = []
+    states = [stc.State('s1',
+                        transitions=[stc.Transition('e1', None, ['a'])])]
+    actions = {'a': lambda _, e: payloads.append(bytes(e.payload))}
+    instance = stc.Statechart(states, actions)
+    pool = stc.BufferPool(buffer_size=4)
+    runner = stc.SyncRunner(pool=pool)
+
+    producer = stc.create_event_ring(['e1'], payload_size=4)
+    consumer = stc.connect_event_ring(producer.name, ['e1'])
+
+    assert producer.put(1, stc.Event('e1', b'abc'))
+    assert producer.put(1, stc.Event('e1', b'de'))
+    assert consumer.drain(runner, {1: instance}, pool=pool) == 2
+    assert len(pool) == 0
+
+    runner.drain()
+    assert payloads == [b'abc', b'de']
+    assert len(pool) == 2
+
+    payload = pool.acquire(b'x')
+    assert isinstance(payload, memoryview)
+    assert len(pool) == 1
+    pool.release(payload)
+    pool.release(b'x')
+    assert len(pool) == 2
+
+    with pytest.raises(ValueError):
+        pool.acquire(b'abcde')
+
+    pool.release(payload)
+    assert len(pool) == 2
+
+    payload = pool.acquire(b'xyz')
+    pool.release(payload[:1])
+    pool.release(payload)
+    pool.release(payload)
+    assert len(pool) == 2
+
+    consumer.close()
+    producer.close()
+    producer.unlink()
+
+
+def test_buffer_pool_broadcast():
+    payloads = []
+    forward = []
+    states = [stc.State('s1',
+                        transitions=[stc.Transition('e1', None, ['a'])])]
+    actions = {'a': lambda c, e: (payloads.append(bytes(e.payload)),
+                                  [runner.register(i, e) for i in forward])}
+    instances = [stc.Statechart(states, actions) for _ in range(3)]
+    pool = stc.BufferPool(buffer_size=4)
+    runner = stc.SyncRunner(pool=pool)
+
+    event = stc.Event('e1', pool.acquire(b'abc'))
+    runner.register(instances[0], event)
+    runner.register(instances[1], event)
+    runner.step()
+    assert len(pool) == 0
+    forward.append(instances[2])
+    runner.step()
+    forward.clear()
+    assert len(pool) == 0
+    runner.drain()
+    assert payloads == [b'abc', b'abc', b'abc']
+    assert len(pool) == 1
+
+
+@pytest.mark.parametrize('runner_type', ['sync', 'mailbox', 'async'])
+async def test_buffer_pool_changes(runner_type):
+    states = [stc.State('s1',
+                        transitions=[stc.Transition('e1', 's2')]),
+              stc.State('s2',
+                        transitions=[stc.Transition('e1', 's1')])]
+    instances = [stc.Statechart(states, {}) for _ in range(2)]
+    pool = stc.BufferPool(buffer_size=4)
+    runner = (stc.SyncRunner(pool=pool) if runner_type == 'sync' else
+              stc.MailboxRunner(pool=pool) if runner_type == 'mailbox' else
+              stc.AsyncRunner(pool=pool))
+
+    payloads = []
+    runner.register_changes_cb(
+        lambda changes: payloads.extend(bytes(change.event.payload)
+                                        for change in changes))
+
+    runner.register(instances[0], stc.Event('e1', pool.acquire(b'a')))
+    runner.register(instances[1], stc.Event('e1', pool.acquire(b'b')))
+    runner.register(instances[0], stc.Event('e2', pool.acquire(b'c')))
+
+    if runner_type == 'async':
+        await asyncio.sleep(0.01)
+        await runner.async_close()
+
+    else:
+        runner.drain()
+
+    assert payloads == [b'a', b'b']
+    assert len(pool) == 3
+
+
+def test_scxml_include(tmp_path):
+    (tmp_path / 'fragment.scxml').write_text(
+        '<scxml xmlns="http://www.w3.org/2005/07/scxml" initial="s2">\n'
+        '    <state id="s1">\n'
+        '        <transition event="e1" target="s2"/>\n'
+        '    </state>\n'
+        '    <state id="s2">\n'
+        '        <transition event="e2" target="s1"/>\n'
+        '        <transition event="e3" target="s4"/>\n'
+        '    </state>\n'
+        '</scxml>\n')
+    main = ('<scxml xmlns="http://www.w3.org/2005/07/scxml" initial="a">\n'
+            '    <state id="a" src="fragment.scxml"/>\n'
+            '    <state id="b" src="fragment.scxml"/>\n'
+            '    <state id="s4"/>\n'
+            '</scxml>\n')
+
+    states = stc.parse_scxml(io.StringIO(main), tmp_path)
+    assert [state.name for state in states] == ['a', 'b', 's4']
+    assert [state.name for state in states[0].children] == ['a.s2', 'a.s1']
+    assert [transition.target
+            for transition in states[1].children[0].transitions] == [
+        'b.s1', 's4']
+
+    instance = stc.Statechart(states)
+    assert instance.state == 'a.s2'
+    instance.step(stc.Event('e2'))
+    assert instance.state == 'a.s1'
+
+    for initial, names in [('x', ['x', 'a.s2', 'a.s1']),
+                           ('a.s1', ['a.s1', 'a.s2', 'x'])]:
+        main = ('<scxml xmlns="http://www.w3.org/2005/07/scxml" '
+                'initial="a">\n'
+                f'    <state id="a" src="fragment.scxml" initial="{initial}">'
+                '\n'
+                '        <state id="x"/>\n'
+                '    </state>\n'
+                '    <state id="s4"/>\n'
+                '</scxml>\n')
+        states = stc.parse_scxml(io.StringIO(main), tmp_path)
+        assert [state.name for state in states[0].children] == names
+
+    (tmp_path / 'a.scxml').write_text(
+        '<scxml xmlns="http://www.w3.org/2005/07/scxml" initial="x">\n'
+        '    <state id="x" src="b.scxml"/>\n'
+        '</scxml>\n')
+    (tmp_path / 'b.scxml').write_text(
+        '<scxml xmlns="http://www.w3.org/2005/07/scxml" initial="old">\n'
+        '    <state id="old"/>\n'
+        '</scxml>\n')
+    (tmp_path / 'main.scxml').write_text(
+        '<scxml xmlns="http://www.w3.org/2005/07/scxml" initial="m">\n'
+        '    <state id="m" src="a.scxml"/>\n'
+        '</scxml>\n')
+
+    instance = stc.Statechart(stc.parse_scxml(str(tmp_path / 'main.scxml')))
+    assert instance.state == 'm.x.old'
+
+    (tmp_path / 'b.scxml').write_text(
+        '<scxml xmlns="http://www.w3.org/2005/07/scxml" initial="new">\n'
+        '    <state id="new"/>\n'
+        '</scxml>\n')
+    os.utime(tmp_path / 'b.scxml', ns=(0, 0))
+
+    instance = stc.Statechart(stc.parse_scxml(tmp_path / 'main.scxml'))
+    assert instance.state == 'm.x.new'
+
+    (tmp_path / 'recursive.scxml').write_text(
+        '<scxml xmlns="http://www.w3.org/2005/07/scxml" initial="a">\n'
+        '    <state id="a" src="recursive.scxml"/>\n'
+        '</scxml>\n')
+    with open(tmp_path / 'recursive.scxml') as f:
+        with pytest.raises(ValueError):
+            stc.parse_scxml(f)
+
+
+def test_encoder():
+    states = [stc.State('s1',
+                        children=[stc.State('s2', entries=['a1']),
+                                  stc.State('h',
+                                            history=stc.HistoryType.DEEP)],
+                        transitions=[stc.Transition('e1', 's3',
+                                                    actions=['a2'],
+                                                    conditions=['c1']),
+                                     stc.Transition('e2', None,
+                                                    internal=True)],
+                        exits=['a3']),
+              stc.State('s3', final=True)]
+
+    data = stc.encode_states(states)
+    assert data == [{'name': 's1',
+                     'children': [{'name': 's2', 'entries': ['a1']},
+                                  {'name': 'h', 'history': 'deep'}],
+                     'transitions': [{'event': 'e1',
+                                      'target': 's3',
+                                      'actions': ['a2'],
+                                      'conditions': ['c1']},
+                                     {'event': 'e2',
+                                      'internal': True}],
+                     'exits': ['a3']},
+                    {'name': 's3', 'final': True}]
+    assert stc.decode_states(json.loads(json.dumps(data))) == states
+
+    scxml = ('<scxml xmlns="http://www.w3.org/2005/07/scxml" initial="s1">\n'
+             '    <state id="s1" initial="s2">\n'
+             '        <onentry>a1</onentry>\n'
+             '        <state id="s2"/>\n'
+             '        <history id="h" type="deep"/>\n'
+             '        <transition event="e1" target="s3" cond="c1">a2'
+             '</transition>\n'
+             '    </state>\n'
+             '    <final id="s3"/>\n'
+             '</scxml>\n')
+    states = stc.parse_scxml(io.StringIO(scxml))
+    assert stc.decode_states(stc.encode_states(states)) == states
+
+
+async def test_create_statecharts():
+    entered = []
+    states = [stc.State('s1',
+                        children=[stc.State('s2')],
+                        transitions=[stc.Transition('e', 's3')]),
+              stc.State('s3', entries=['a'])]
+    model = stc.Model(states, {'a': lambda c, e: entered.append(c.context)})
+
+    instances = stc.create_statecharts(model, range(3))
+    assert [i.context for i in instances] == [0, 1, 2]
+    assert all(i.state == 's2' for i in instances)
+    assert all(type(i) is stc.Statechart for i in instances)
+
+    instances[0].step(stc.Event('e'))
+    assert instances[0].state == 's3'
+    assert entered == [0]
+
+    model = stc.Model(list(reversed(states)),
+                      {'a': lambda c, e: entered.append(c.context)})
+    entered = []
+    instances = stc.create_statecharts(model, range(5), initialize=False)
+    assert all(i.state is None for i in instances)
+    assert entered == []
+
+    runner = stc.AsyncRunner()
+    await runner.initialize(instances, batch_size=2)
+    assert all(i.state == 's3' for i in instances)
+    assert entered == list(range(5))
+    await runner.async_close()
+
+    cls = stc.compile_statechart(states)
+    instances = stc.create_statecharts(
+        stc.Model(states, {'a': lambda c, e: None}), [None], cls)
+    assert type(instances[0]) is cls
+    assert instances[0].state == 's2'
+
+
+def test_model_compile_time():
+    count = 10000
+    states = [stc.State(f's{i}',
+                        transitions=[stc.Transition(f'e{i}',
+                                                    f's{(i + 1) % count}')])
+              for i in range(count)]
+
+    start = time.monotonic()
+    model = stc.Model(states, {})
+    assert time.monotonic() - start < 5
+
+    assert model.states[0].dispatch == {'e0': model.states[0].transitions}
+    assert model.get_candidates(0, 'e1') == ()
+
+
+def test_model_sharing():
+    def create_states(prefix):
+        return [stc.State(f'{prefix}1',
+                          transitions=[stc.Transition('e1', f'{prefix}2',
+                                                      ['a1'], ['c1'])],
+                          entries=['a1']),
+                stc.State(f'{prefix}2',
+                          children=[stc.State(f'{prefix}3')],
+                          transitions=[stc.Transition('e2', f'{prefix}1',
+                                                      ['a1'], ['c1'])],
+                          entries=['a1'])]
+
+    states = [stc.State('s1', children=create_states('x')),
+              stc.State('s2', children=create_states('y'))]
+    model = stc.Model(states,
+                      {'a1': lambda _, __: None},
+                      {'c1': lambda _, __: True})
+
+    x1, x2, x3, y1, y2 = (model.states[model.get_state_index(name)]
+                          for name in ['x1', 'x2', 'x3', 'y1', 'y2'])
+
+    assert x1.entry_actions is y1.entry_actions
+    assert x1.transitions[0].effects is y2.transitions[0].effects
+    assert x1.transitions[0].guards is y1.transitions[0].guards
+    assert x3.dispatch is x2.dispatch
+    assert x1.dispatch is not x2.dispatch
+    assert [t.target for t in x3.dispatch['e2']] == [x1.path[-1]]
+
+    instance = stc.Statechart(model)
+    instance.step(stc.Event('e1'))
+    assert instance.state == 'x3'
+    instance.step(stc.Event('e3'))
+    instance.step(stc.Event('e2'))
+    assert instance.state == 'x1'
+
+
+@pytest.mark.parametrize('generated', [False, True])
+def test_coverage(generated):
+    states = [stc.State('s1',
+                        children=[stc.State('s2')],
+                        transitions=[stc.Transition('e1', 's3'),
+                                     stc.Transition('e2', 's4')]),
+              stc.State('s3',
+                        transitions=[stc.Transition('e1', 's1')]),
+              stc.State('s4')]
+    cls = stc.compile_statechart(states) if generated else stc.Statechart
+    model = stc.Model(states, {})
+    assert model.coverage is None
+
+    coverage = model.start_coverage()
+    assert model.start_coverage() is coverage
+
+    instances = [cls(model) for _ in range(2)]
+    for _ in range(3):
+        instances[0].step(stc.Event('e1'))
+    instances[1].step(stc.Event('e3'))
+
+    assert coverage.initial_count == 2
+    assert coverage.transition_counts == [2, 0, 1]
+    assert coverage.get_state_counts() == [3, 3, 2, 0]
+
+    highlight = stc.coverage_to_dot_highlight(coverage)
+    assert highlight.states['s1'] == '3'
+    assert highlight.transitions[('s1', 1)] == '0'
+    assert highlight.state_colors['s4'] != highlight.state_colors['s1']
+    assert '#' in stc.create_dot_graph(states, highlight=highlight)
+
+    model.stop_coverage()
+    instances[1].step(stc.Event('e1'))
+    assert coverage.transition_counts == [2, 0, 1]
+
+
+def test_sync_timer():
+    events = []
+    runner = stc.SyncRunner()
+    timer = stc.SyncTimer(runner=runner,
+                          event='timeout',
+                          duration=0)
+    states = [stc.State('s1',
+                        entries=['start'],
+                        exits=['stop'],
+                        transitions=[stc.Transition('timeout', 's2',
+                                                    conditions=['timer']),
+                                     stc.Transition('restart', 's1')]),
+              stc.State('s2',
+                        entries=['done'])]
+    actions = {'start': timer.start,
+               'stop': timer.stop,
+               'done': lambda _, e: events.append(e.payload)}
+    conditions = {'timer': timer.condition}
+
+    assert runner.next_timeout is None
+    instance = stc.Statechart(states, actions, conditions)
+    assert runner.next_timeout == 0
+
+    runner.register(instance, stc.Event('restart'))
+    runner.drain()
+    assert instance.state == 's1'
+    assert runner.empty
+
+    runner.drain()
+    assert instance.state == 's2'
+    assert len(events) == 1
+    assert runner.next_timeout is None
+
+    instance = stc.Statechart(states, actions, conditions)
+    for _ in range(1000):
+        timer.start(instance, None)
+    runner.drain()
+    assert instance.state == 's2'
+    assert len(events) == 2
+    assert runner.next_timeout is None
+
+    timer = stc.SyncTimer(runner=runner,
+                          event='timeout',
+                          duration=60)
+    for _ in range(1000):
+        timer.start(instance, None)
+    assert 0 < runner.next_timeout <= 60
+
+    timer.stop(instance, None)
+    assert runner.next_timeout is None
+
+
+async def test_runner_timers():
+    events = []
+    runner = stc.AsyncRunner()
+    timer1 = runner.create_timer('t1', 0.01)
+    timer2 = runner.create_timer('t2', 0.01)
+    states = [stc.State('s1',
+                        entries=['start_t1', 'start_t2'],
+                        transitions=[stc.Transition('t1', 's2',
+                                                    conditions=['t1']),
+                                     stc.Transition('t2', 's3',
+                                                    conditions=['t2'])]),
+              stc.State('s2',
+                        entries=['done']),
+              stc.State('s3',
+                        entries=['done'])]
+    actions = {'start_t1': timer1.start,
+               'start_t2': timer2.start,
+               'done': lambda i, e: events.append((i.context, e.name))}
+    conditions = {'t1': timer1.condition,
+                  't2': timer2.condition}
+    model = stc.Model(states, actions, conditions)
+
+    instance1 = stc.Statechart(model, context=1)
+    runner.discard_timers(instance1)
+    instance2 = stc.Statechart(model, context=2)
+
+    await asyncio.sleep(0.05)
+    assert events == [(2, 't1')]
+    assert instance1.state == 's1'
+    assert instance2.state == 's2'
+
+    timer1.close()
+    timer1.start(instance1, None)
+    assert not timer1.condition(instance1, stc.Event('t1', None))
+
+    timer3 = runner.create_timer('t3', 0)
+    timer3.start(instance1, None)
+    await asyncio.sleep(0.01)
+    assert events == [(2, 't1')]
+    assert instance1.state == 's1'
+
+    await runner.async_close()
+
+
+def test_sync_runner_timers():
+    events = []
+    runner = stc.SyncRunner()
+    timers = [runner.create_timer('t', 0) for _ in range(3)]
+    states = [stc.State('s1',
+                        transitions=[stc.Transition('t', None, ['record'],
+                                                    ['timer'])])]
+    actions = {'record': lambda i, _: events.append(i.context)}
+    conditions = {'timer': lambda i, e: any(timer.condition(i, e)
+                                            for timer in timers)}
+    instances = [stc.Statechart(states, actions, conditions, context=i)
+                 for i in range(3)]
+
+    for _ in range(1000):
+        timers[0].start(instances[0], None)
+    runner.drain()
+    assert events == [0]
+    assert runner.next_timeout is None
+    events.clear()
+
+    timers[0].start(instances[0], None)
+    timers[1].start(instances[0], None)
+    timers[2].start(instances[1], None)
+    runner.discard_timers(instances[0])
+    assert runner.next_timeout == 0
+    runner.drain()
+    assert events == [1]
+    events.clear()
+
+    timers[2].start(instances[1], None)
+    timers[2].start(instances[2], None)
+    runner.discard_timers(instances[1])
+    runner.drain()
+    assert events == [2]
+    events.clear()
+
+    timers[2].start(instances[2], None)
+    timers[2].stop(instances[2], None)
+    assert runner.next_timeout is None
+
+    timers[1].close()
+    timers[1].start(instances[0], None)
+    assert runner.next_timeout is None
+
+    runner.drain()
+    assert events == []
+
+
+@pytest.mark.parametrize('descriptor, tokens, wildcard', [
+    ('*', [], True),
+    ('error', ['error'], False),
+    ('error.', ['error'], False),
+    ('error.*', ['error'], True),
+    ('error.io.read', ['error', 'io', 'read'], False)])
+def test_descriptor_tokens(descriptor, tokens, wildcard):
+    assert stc.get_descriptor_tokens(descriptor) == tokens
+    assert stc.is_wildcard_descriptor(descriptor) == wildcard